@@ -0,0 +1,296 @@
+"""
+Admission control for the scoring endpoints
+
+Each process lets at most ADMISSION_MAX_IN_FLIGHT scoring requests run at
+once, ADMISSION_RESERVED_FOR_WRITES of them only for origination (writes).
+Requests over the limit wait in a short queue, writes ahead of reads; a
+read that cannot start within ADMISSION_READ_QUEUE_TIMEOUT, or finds the
+queue full, is shed at once with 503 and Retry-After instead of tying up
+a worker thread. A customer may have at most ADMISSION_MAX_PER_CUSTOMER
+reads in flight or queued (429 beyond that); origination is not limited
+per customer.
+
+A background thread in each process adds its admitted and shed counts to
+the shared cache every ADMISSION_STATS_INTERVAL seconds and publishes its
+in-flight and queued requests there, so cluster_stats() covers every
+worker without a cache round trip on the request path.
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+READ = 'read'
+WRITE = 'write'
+SHED_REASONS = ('customer_limit', 'queue_full', 'queue_timeout')
+WORKERS_KEY = 'admission:workers'
+# At most one warning per this many seconds while the cache is unreachable
+PUBLISH_WARNING_INTERVAL = 60
+
+class Rejected(Exception):
+    def __init__(self, reason, status_code):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+
+def _new_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+class AdmissionController:
+    def __init__(self, max_in_flight=None, reserved_for_writes=None, max_queue=None,
+                 max_per_customer=None, queue_timeouts=None):
+        self.max_in_flight = max_in_flight or settings.ADMISSION_MAX_IN_FLIGHT
+        self.reserved_for_writes = (
+            settings.ADMISSION_RESERVED_FOR_WRITES if reserved_for_writes is None else reserved_for_writes
+        )
+        self.max_queue = max_queue or settings.ADMISSION_MAX_QUEUE
+        self.max_per_customer = max_per_customer or settings.ADMISSION_MAX_PER_CUSTOMER
+        self.queue_timeouts = queue_timeouts or {
+            READ: settings.ADMISSION_READ_QUEUE_TIMEOUT,
+            WRITE: settings.ADMISSION_WRITE_QUEUE_TIMEOUT,
+        }
+        self._condition = threading.Condition()
+        self._customers = Counter()
+        self.in_flight = {READ: 0, WRITE: 0}
+        self.queued = {READ: 0, WRITE: 0}
+        self.admitted = Counter()
+        self.shed = Counter()
+        # Counts not yet added to the shared cache
+        self._unpublished = Counter()
+        self._publisher = None
+        self._pid = None
+        self.worker_id = _new_worker_id()
+        self._last_warning = None
+
+    def _limit(self, priority):
+        if priority == WRITE:
+            return self.max_in_flight
+        return max(1, self.max_in_flight - self.reserved_for_writes)
+
+    def _can_start(self, priority):
+        if sum(self.in_flight.values()) >= self._limit(priority):
+            return False
+        # Queued writes go first
+        return priority == WRITE or not self.queued[WRITE]
+
+    def _reject(self, priority, reason, status_code):
+        self.shed[f'{priority}:{reason}'] += 1
+        self._unpublished[f'shed:{priority}:{reason}'] += 1
+        return Rejected(reason, status_code)
+
+    def acquire(self, priority, customer_id=None):
+        """
+        Wait for a slot; raises Rejected if the request is shed
+        """
+        self._ensure_publisher()
+        if priority == WRITE:
+            # Origination is never limited per customer
+            customer_id = None
+        with self._condition:
+            if customer_id is not None and self._customers[customer_id] >= self.max_per_customer:
+                raise self._reject(priority, 'customer_limit', status.HTTP_429_TOO_MANY_REQUESTS)
+
+            if not self._can_start(priority):
+                if self.queued[priority] >= self.max_queue:
+                    raise self._reject(priority, 'queue_full', status.HTTP_503_SERVICE_UNAVAILABLE)
+                self._hold_customer(customer_id)
+                self.queued[priority] += 1
+                deadline = time.monotonic() + self.queue_timeouts[priority]
+                try:
+                    while not self._can_start(priority):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._release_customer(customer_id)
+                            raise self._reject(priority, 'queue_timeout', status.HTTP_503_SERVICE_UNAVAILABLE)
+                        self._condition.wait(remaining)
+                finally:
+                    self.queued[priority] -= 1
+                    # Reads may have been waiting only for this write to leave the queue
+                    self._condition.notify_all()
+            else:
+                self._hold_customer(customer_id)
+
+            self.in_flight[priority] += 1
+            self.admitted[priority] += 1
+            self._unpublished[f'admitted:{priority}'] += 1
+
+    def release(self, priority, customer_id=None):
+        if priority == WRITE:
+            customer_id = None
+        with self._condition:
+            self.in_flight[priority] -= 1
+            self._release_customer(customer_id)
+            self._condition.notify_all()
+
+    def _hold_customer(self, customer_id):
+        if customer_id is not None:
+            self._customers[customer_id] += 1
+
+    def _release_customer(self, customer_id):
+        if customer_id is None:
+            return
+        self._customers[customer_id] -= 1
+        if self._customers[customer_id] <= 0:
+            del self._customers[customer_id]
+
+    def publish(self):
+        """
+        Add this worker's unpublished counts to the shared cache and publish
+        its live state; counts that could not be sent are kept for next time
+        """
+        with self._condition:
+            counts, self._unpublished = self._unpublished, Counter()
+            state = {
+                'worker': self.worker_id,
+                'in_flight': dict(self.in_flight),
+                'queued': dict(self.queued),
+            }
+        interval = settings.ADMISSION_STATS_INTERVAL
+        sent = Counter()
+        try:
+            for name, count in counts.items():
+                _add_shared(name, count)
+                sent[name] = count
+            # Expires if the worker stops publishing, e.g. after it exits
+            cache.set(_worker_key(self.worker_id), state, timeout=3 * interval)
+            workers = cache.get(WORKERS_KEY) or []
+            if self.worker_id not in workers:
+                alive = cache.get_many([_worker_key(worker_id) for worker_id in workers])
+                workers = [worker_id for worker_id in workers if _worker_key(worker_id) in alive]
+                cache.set(WORKERS_KEY, workers + [self.worker_id], timeout=None)
+        except Exception:
+            with self._condition:
+                self._unpublished.update(counts - sent)
+            now = time.monotonic()
+            if self._last_warning is None or now - self._last_warning >= PUBLISH_WARNING_INTERVAL:
+                self._last_warning = now
+                logger.warning("Could not publish admission stats to the cache", exc_info=True)
+
+    def _ensure_publisher(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._condition:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # Forked child: the parent publishes what it counted
+                self._unpublished.clear()
+            self._pid = pid
+            self.worker_id = _new_worker_id()
+            self._publisher = threading.Thread(target=self._run_publisher, name='admission-stats', daemon=True)
+            self._publisher.start()
+
+    def _run_publisher(self):
+        while True:
+            time.sleep(settings.ADMISSION_STATS_INTERVAL)
+            self.publish()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pid': os.getpid(),
+                'worker': self.worker_id,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': dict(self.in_flight),
+                'queued': dict(self.queued),
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed),
+            }
+
+def _shared_key(name):
+    return f'admission:{name}'
+
+def _worker_key(worker_id):
+    return f'admission:worker:{worker_id}'
+
+def _add_shared(name, count):
+    key = _shared_key(name)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        # First count: another worker may create the key at the same time
+        if not cache.add(key, count, timeout=None):
+            cache.incr(key, count)
+
+def cluster_stats():
+    """
+    Admitted and shed counts summed over every worker sharing the cache,
+    and the in-flight and queued requests of each live worker. Counts lag
+    by up to ADMISSION_STATS_INTERVAL seconds.
+    """
+    names = [f'admitted:{priority}' for priority in (READ, WRITE)] + [
+        f'shed:{priority}:{reason}' for priority in (READ, WRITE) for reason in SHED_REASONS
+    ]
+    counts = cache.get_many([_shared_key(name) for name in names])
+    values = {name: counts.get(_shared_key(name), 0) for name in names}
+    
+    worker_keys = [_worker_key(worker_id) for worker_id in cache.get(WORKERS_KEY) or []]
+    live = cache.get_many(worker_keys)
+    workers = [live[key] for key in worker_keys if key in live]
+    return {
+        'admitted': {priority: values[f'admitted:{priority}'] for priority in (READ, WRITE)},
+        'shed': {
+            name.split(':', 1)[1]: value for name, value in values.items()
+            if name.startswith('shed:') and value
+        },
+        'in_flight': {priority: sum(worker['in_flight'][priority] for worker in workers) for priority in (READ, WRITE)},
+        'queued': {priority: sum(worker['queued'][priority] for worker in workers) for priority in (READ, WRITE)},
+        'workers': workers,
+    }
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
+
+def _customer_id(request):
+    data = request.data
+    customer_id = data.get('customer_id') if hasattr(data, 'get') else None
+    return None if customer_id is None else str(customer_id)
+
+def admission_controlled(priority):
+    """
+    Decorator for APIView handlers: run the handler only once admitted,
+    otherwise respond 503/429 with Retry-After
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if not settings.ADMISSION_CONTROL_ENABLED:
+                return handler(view, request, *args, **kwargs)
+
+            controller = get_controller()
+            customer_id = _customer_id(request)
+            try:
+                controller.acquire(priority, customer_id)
+            except Rejected as exc:
+                response = Response(
+                    {"error": "Too many requests, please retry shortly", "reason": exc.reason},
+                    status=exc.status_code
+                )
+                response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+                return response
+            try:
+                return handler(view, request, *args, **kwargs)
+            finally:
+                controller.release(priority, customer_id)
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+"""
+Portfolio exposure analytics, computed with grouped aggregate queries and
+cached until the TTL expires or a loan/customer write invalidates it
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from .models import Loan
+from .sharding import run_on_all_shards
+
+CACHE_VERSION_KEY = 'portfolio-exposure:version'
+
+# (lower bound inclusive, upper bound exclusive, label)
+TENURE_BANDS = [
+    (None, 13, '0-12'),
+    (13, 25, '13-24'),
+    (25, 61, '25-60'),
+    (61, None, '61+'),
+]
+
+RATE_BANDS = [
+    (None, 8, '<8'),
+    (8, 12, '8-12'),
+    (12, 16, '12-16'),
+    (16, None, '16+'),
+]
+
+def _band(field, bands):
+    whens = []
+    for lower, upper, label in bands:
+        bounds = {}
+        if lower is not None:
+            bounds[f'{field}__gte'] = lower
+        if upper is not None:
+            bounds[f'{field}__lt'] = upper
+        whens.append(When(then=Value(label), **bounds))
+    return Case(*whens, output_field=CharField())
+
+BREAKDOWNS = {
+    'by_tenure_band': lambda: _band('tenure', TENURE_BANDS),
+    'by_rate_band': lambda: _band('interest_rate', RATE_BANDS),
+    'by_start_year': lambda: ExtractYear('start_date'),
+}
+
+# Raw sums only, so partial results can be added together before the
+# ratios are taken
+METRICS = (
+    'loans', 'total_loan_amount', 'rate_weighted_amount', 'total_monthly_emi',
+    'borrowers', 'emi_burden_sum', 'emi_burden_count',
+)
+
+def _metrics():
+    # EMI burden is per borrower: a customer's EMIs over their salary. Summed
+    # over borrowers that equals the sum of each loan's EMI over its
+    # customer's salary, so it needs no per-customer grouping. A customer's
+    # loans all live on one shard, so the distinct counts add across shards.
+    has_salary = Q(customer__monthly_salary__gt=0)
+    return {
+        'loans': Count('loan_id'),
+        'total_loan_amount': Sum('loan_amount'),
+        'rate_weighted_amount': Sum(F('loan_amount') * F('interest_rate'), output_field=FloatField()),
+        'total_monthly_emi': Sum('monthly_repayment'),
+        'borrowers': Count('customer_id', distinct=True),
+        'emi_burden_sum': Sum(
+            F('monthly_repayment') / F('customer__monthly_salary'), filter=has_salary, output_field=FloatField()
+        ),
+        'emi_burden_count': Count('customer_id', distinct=True, filter=has_salary),
+    }
+
+def _finalize(row):
+    total = row['total_loan_amount'] or 0
+    return {
+        'loans': row['loans'],
+        'total_loan_amount': round(total, 2),
+        'weighted_average_interest_rate': round(row['rate_weighted_amount'] / total, 4) if total else None,
+        'total_monthly_emi': round(row['total_monthly_emi'] or 0, 2),
+        'borrowers': row['borrowers'],
+        'average_emi_to_salary_ratio': (
+            round(row['emi_burden_sum'] / row['emi_burden_count'], 4) if row['emi_burden_count'] else None
+        ),
+    }
+
+def _shard_exposure(alias):
+    approved = Loan.objects.using(alias).filter(status='APPROVED')
+    result = {'totals': approved.aggregate(**_metrics())}
+    for name, bucket in BREAKDOWNS.items():
+        rows = approved.annotate(bucket=bucket()).values('bucket').annotate(**_metrics())
+        result[name] = {row['bucket']: row for row in rows}
+    return result
+
+def _add(rows):
+    return {metric: sum(row[metric] or 0 for row in rows) for metric in METRICS}
+
+def compute_portfolio_exposure():
+    """
+    Exposure of the approved book, overall and per tenure band, rate band
+    and start year (one grouped query each per shard, merged here)
+    """
+    shards = list(run_on_all_shards(_shard_exposure).values())
+    result = {
+        'generated_at': timezone.now().isoformat(),
+        'totals': _finalize(_add([shard['totals'] for shard in shards])),
+    }
+    for name in BREAKDOWNS:
+        buckets = sorted(
+            {bucket for shard in shards for bucket in shard[name]},
+            key=lambda bucket: (bucket is None, bucket)
+        )
+        result[name] = [
+            {'bucket': bucket, **_finalize(_add([shard[name][bucket] for shard in shards if bucket in shard[name]]))}
+            for bucket in buckets
+        ]
+    return result
+
+def _cache_key():
+    version = cache.get_or_set(CACHE_VERSION_KEY, time.time_ns, None)
+    return f'portfolio-exposure:{version}'
+
+def get_portfolio_exposure():
+    """
+    Cached portfolio exposure; recomputed after the TTL or an invalidation
+    """
+    key = _cache_key()
+    result = cache.get(key)
+    if result is None:
+        result = compute_portfolio_exposure()
+        cache.set(key, result, settings.PORTFOLIO_EXPOSURE_CACHE_TIMEOUT)
+    return result
+
+def invalidate_portfolio_exposure():
+    """
+    Bump the cache version so the next read recomputes. A computation that
+    was already running stores its result under the old key, so a write
+    that lands mid-computation cannot be hidden by a stale entry.
+    """
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, time.time_ns(), None)
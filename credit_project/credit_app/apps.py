@@ -1,6 +1,9 @@
-from django.apps import AppConfig
-
-
-class CreditAppConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'credit_app'
+from django.apps import AppConfig
+
+
+class CreditAppConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'credit_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,195 @@
+"""
+Buffered audit log of eligibility and origination decisions
+
+Views call record_decision(), which only appends to an in-process buffer.
+A background thread writes the buffer to DecisionAuditLog with batched
+INSERTs once AUDIT_BATCH_SIZE records are waiting or every
+AUDIT_FLUSH_INTERVAL seconds. The buffer holds at most AUDIT_BUFFER_SIZE
+records: when it is full the recording request writes a batch itself
+(backpressure) instead of dropping decisions. Whatever is left is written
+when the process exits, including gunicorn and Celery worker shutdown.
+
+A batch that fails AUDIT_MAX_ATTEMPTS times in a row is appended to a
+JSON-lines file in AUDIT_DEAD_LETTER_DIR (or logged, if that fails too) so
+it cannot block later batches. Recording never raises into the request.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import DecisionAuditLog
+
+logger = logging.getLogger(__name__)
+
+class AuditBuffer:
+    def __init__(self, max_size=None, batch_size=None, flush_interval=None, max_attempts=None):
+        self.max_size = max_size or settings.AUDIT_BUFFER_SIZE
+        self.batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_FLUSH_INTERVAL
+        self.max_attempts = max_attempts or settings.AUDIT_MAX_ATTEMPTS
+        self._records = deque()
+        self._lock = threading.Lock()
+        # One batch is written at a time, so a failed batch can be put back in order
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        # Consecutive failures of the batch at the head of the buffer
+        self._attempts = 0
+        self.written = 0
+        self.backpressure_flushes = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+
+    def record(self, record):
+        """
+        Buffer one record. Never raises: a failed backpressure write is
+        logged, and retrying it ends once the batch is dead-lettered.
+        """
+        self._ensure_thread()
+        while True:
+            with self._lock:
+                if len(self._records) < self.max_size:
+                    self._records.append(record)
+                    pending = len(self._records)
+                    break
+                # Buffer full: write a batch in this thread before adding more
+                self.backpressure_flushes += 1
+            try:
+                self._write_batch()
+            except Exception:
+                logger.exception("Audit log backpressure flush failed")
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write every buffered record; returns the number written
+        """
+        written = 0
+        while True:
+            count = self._write_batch()
+            if not count:
+                return written
+            written += count
+
+    def pending(self):
+        return len(self._records)
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'written': self.written,
+            'backpressure_flushes': self.backpressure_flushes,
+            'failed_flushes': self.failed_flushes,
+            'dead_lettered': self.dead_lettered,
+        }
+
+    def _write_batch(self):
+        with self._write_lock:
+            with self._lock:
+                batch = [self._records.popleft() for _ in range(min(self.batch_size, len(self._records)))]
+            if not batch:
+                return 0
+            try:
+                DecisionAuditLog.objects.bulk_create([DecisionAuditLog(**record) for record in batch])
+            except Exception:
+                self.failed_flushes += 1
+                self._attempts += 1
+                if self._attempts >= self.max_attempts:
+                    # Stop retrying so the batch cannot hold up everything behind it
+                    self._attempts = 0
+                    self._dead_letter(batch)
+                else:
+                    # Keep the records for the next attempt rather than lose them
+                    with self._lock:
+                        self._records.extendleft(reversed(batch))
+                raise
+            self._attempts = 0
+            self.written += len(batch)
+            return len(batch)
+
+    def _dead_letter(self, batch):
+        self.dead_lettered += len(batch)
+        lines = [json.dumps(record, cls=DjangoJSONEncoder) for record in batch]
+        try:
+            directory = settings.AUDIT_DEAD_LETTER_DIR
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f'audit-{os.getpid()}.jsonl'), 'a') as f:
+                f.write(''.join(line + '\n' for line in lines))
+        except OSError:
+            logger.exception("Could not write audit dead-letter file")
+            for line in lines:
+                logger.error("Audit record not written: %s", line)
+        else:
+            logger.error("Audit batch of %d records failed %d times; written to %s",
+                         len(batch), self.max_attempts, directory)
+
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # Forked child: the parent still owns (and will write) what it buffered
+                self._records.clear()
+                self._wakeup = threading.Event()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='audit-log-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Audit log flush failed; %d records kept for retry", self.pending())
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AuditBuffer()
+    return _buffer
+
+def record_decision(decision, **fields):
+    """
+    Queue one decision for the audit log; fields are DecisionAuditLog fields
+    """
+    if not settings.AUDIT_ENABLED:
+        return
+    get_buffer().record({'decision': decision, 'decided_at': timezone.now(), **fields})
+
+def flush_audit_log(**kwargs):
+    """
+    Write everything buffered in this process (also run at shutdown)
+    """
+    if _buffer is None or not _buffer.pending():
+        return 0
+    try:
+        return _buffer.flush()
+    except Exception:
+        logger.exception("Audit log flush failed; %d records not written", _buffer.pending())
+        return 0
+
+atexit.register(flush_audit_log)
+worker_process_shutdown.connect(flush_audit_log, weak=False)
+worker_shutdown.connect(flush_audit_log, weak=False)
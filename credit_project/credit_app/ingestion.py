@@ -0,0 +1,193 @@
+"""
+Helpers for the Excel ingestion tasks: column normalisation, value parsing
+and the structured run report
+"""
+import csv
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+PHASES = ('fingerprint', 'read', 'transform', 'validate', 'write')
+
+# Spreadsheet headers that do not match the model field names once normalised
+COLUMN_ALIASES = {
+    'monthly_payment': 'monthly_repayment',
+    'date_of_approval': 'start_date',
+}
+
+class RowError(ValueError):
+    """
+    A row that cannot be ingested; the message is recorded as the reason
+    """
+
+def normalise_column(name):
+    """
+    'Customer ID' -> 'customer_id', 'Monthly payment' -> 'monthly_repayment'
+    """
+    key = '_'.join(str(name).strip().lower().split())
+    return COLUMN_ALIASES.get(key, key)
+
+def read_frame(file_path):
+    df = pd.read_excel(file_path)
+    df.columns = [normalise_column(column) for column in df.columns]
+    return df
+
+def parse_value(row, key, cast, default=None):
+    value = row.get(key)
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise RowError(f"Invalid {key}: {value!r}")
+
+def parse_int(value):
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(value)
+    return int(number)
+
+def parse_phone(value):
+    # Excel stores phone numbers as numbers; drop the trailing '.0'
+    return value.strip() if isinstance(value, str) else str(parse_int(value))
+
+def parse_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    if isinstance(value, datetime) or hasattr(value, 'to_pydatetime'):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    raise ValueError(value)
+
+def field_error(model, record):
+    """
+    Reason the record violates one of the model's field constraints (null,
+    max_length, integer range, ...), or None
+    """
+    for name, value in record.items():
+        field = model._meta.get_field(name)
+        if value is None:
+            if not field.null and not field.primary_key:
+                return f"Missing {name}"
+            continue
+        try:
+            field.run_validators(field.to_python(value))
+        except ValidationError as e:
+            return f"Invalid {name}: {' '.join(e.messages)}"
+    return None
+
+def file_fingerprint(file_path):
+    """
+    (sha256 hex digest, size in bytes) of a file, read in 1 MiB blocks
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+def row_hash(record):
+    """
+    Stable hash of a parsed row, stored as source_hash to detect changes
+    """
+    payload = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+def _json_safe(value):
+    if isinstance(value, (date, datetime)) or hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if not isinstance(value, str) and pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+class IngestionReport:
+    """
+    Structured result of one ingestion run: row counts, time per phase and
+    a bounded CSV of rejected rows with the reason for each
+    """
+    def __init__(self, dataset, file_path, max_rejected_rows=None):
+        self.dataset = dataset
+        self.file_path = file_path
+        self.max_rejected_rows = (
+            settings.INGESTION_MAX_REJECTED_ROWS if max_rejected_rows is None else max_rejected_rows
+        )
+        self.started_at = timezone.now()
+        self._started = time.monotonic()
+        self.phases = {phase: 0.0 for phase in PHASES}
+        self.counts = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+        self.status = 'ok'
+        self.error = None
+        self.rejected_rows_file = None
+        self.rejected_rows_written = 0
+        self._rejected_handle = None
+        self._rejected_writer = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.monotonic() - started
+
+    def reject(self, row_number, reason, row):
+        self.counts['rejected'] += 1
+        if self.rejected_rows_written >= self.max_rejected_rows:
+            return
+        if self._rejected_writer is None:
+            report_dir = settings.INGESTION_REPORT_DIR
+            os.makedirs(report_dir, exist_ok=True)
+            stamp = self.started_at.strftime('%Y%m%dT%H%M%S%f')
+            self.rejected_rows_file = os.path.join(report_dir, f'{self.dataset}-{stamp}-rejected.csv')
+            self._rejected_handle = open(self.rejected_rows_file, 'w', newline='')
+            self._rejected_writer = csv.writer(self._rejected_handle)
+            self._rejected_writer.writerow(['row_number', 'reason', 'row'])
+        row_data = {str(key): _json_safe(value) for key, value in row.items()}
+        self._rejected_writer.writerow([row_number, reason, json.dumps(row_data, default=str)])
+        self.rejected_rows_written += 1
+
+    def file_unchanged(self):
+        self.status = 'unchanged'
+
+    def fail(self, error):
+        self.status = 'failed'
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        if self._rejected_handle is not None:
+            self._rejected_handle.close()
+            self._rejected_handle = None
+        elapsed = time.monotonic() - self._started
+        return {
+            'dataset': self.dataset,
+            'file': self.file_path,
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at.isoformat(),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.counts['read'] / elapsed, 1) if elapsed > 0 else None,
+            **{f'rows_{name}': count for name, count in self.counts.items()},
+            'phases': {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            'rejected_rows_file': self.rejected_rows_file,
+            'rejected_rows_written': self.rejected_rows_written,
+            'rejected_rows_truncated': self.counts['rejected'] > self.rejected_rows_written,
+        }
+
+def missing_file_report(dataset, file_path):
+    return {
+        'dataset': dataset,
+        'file': file_path,
+        'status': 'missing',
+        'error': f"File not found at {file_path}",
+    }
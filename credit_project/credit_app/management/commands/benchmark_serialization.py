@@ -0,0 +1,87 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from credit_app.models import Customer, Loan
+from credit_app.serializers import (
+    CustomerLoanSerializer, CustomerLoanRowSerializer,
+    LoanDetailSerializer, LoanDetailRowSerializer
+)
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Compare per-row cost of the ModelSerializer and values() fast-path read serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Loans to generate for a synthetic customer')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path (best is reported)')
+        parser.add_argument('--customer-id', type=int, help='Benchmark an existing customer instead of synthetic data')
+
+    def handle(self, *args, **options):
+        if options['customer_id']:
+            self._benchmark(options['customer_id'], options['repeat'])
+            return
+
+        # Synthetic data is created inside a transaction that is always rolled back
+        try:
+            with transaction.atomic():
+                customer = Customer.objects.create(
+                    first_name='Bench', last_name='Mark', age=40, phone_number='9999999999',
+                    monthly_salary=100000, approved_limit=3600000
+                )
+                Loan.objects.bulk_create([
+                    Loan(
+                        customer=customer, loan_amount=100000 + i, tenure=12 + i % 48,
+                        interest_rate=8 + (i % 80) / 10, monthly_repayment=2500 + i / 7,
+                        start_date=date(2020, 1 + i % 12, 1), status='APPROVED'
+                    )
+                    for i in range(options['rows'])
+                ], batch_size=1000)
+                self._benchmark(customer.customer_id, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _best_of(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            payload = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, payload
+
+    def _benchmark(self, customer_id, repeat):
+        loans = Loan.objects.filter(customer_id=customer_id, status='APPROVED')
+        rows = loans.count()
+        if not rows:
+            raise CommandError(f"Customer {customer_id} has no approved loans")
+
+        def model_path():
+            return JSONRenderer().render(CustomerLoanSerializer(loans, many=True).data)
+
+        def fast_path():
+            serializer = CustomerLoanRowSerializer()
+            return JSONRenderer().render(serializer.many(loans.values(*serializer.sources)))
+
+        model_time, model_payload = self._best_of(repeat, model_path)
+        fast_time, fast_payload = self._best_of(repeat, fast_path)
+        if model_payload != fast_payload:
+            raise CommandError("Fast-path /view-loans/ payload differs from the ModelSerializer payload")
+
+        self.stdout.write(f"/view-loans/{customer_id}/ ({rows} loans, best of {repeat})")
+        self.stdout.write(f"  ModelSerializer + JSONRenderer:     {model_time * 1e6 / rows:8.2f} us/row")
+        self.stdout.write(f"  values() fast path + JSONRenderer:  {fast_time * 1e6 / rows:8.2f} us/row")
+        self.stdout.write(self.style.SUCCESS(f"  speedup {model_time / fast_time:.1f}x, payloads identical"))
+
+        loan_id = loans.values_list('loan_id', flat=True).first()
+        detail = Loan.objects.filter(loan_id=loan_id)
+        model_detail = JSONRenderer().render(LoanDetailSerializer(detail.get()).data)
+        serializer = LoanDetailRowSerializer()
+        fast_detail = JSONRenderer().render(serializer.to_representation(detail.values(*serializer.sources).get()))
+        if model_detail != fast_detail:
+            raise CommandError("Fast-path /view-loan/ payload differs from the ModelSerializer payload")
+        self.stdout.write(self.style.SUCCESS(f"/view-loan/{loan_id}/ payloads identical"))
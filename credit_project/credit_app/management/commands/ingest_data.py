@@ -1,12 +1,38 @@
-from django.core.management.base import BaseCommand
-from credit_app.tasks import process_data_files
-
-class Command(BaseCommand):
-    help = 'Ingest data from Excel files'
-
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('Starting data ingestion...'))
-        results = process_data_files()
-        for result in results:
-            self.stdout.write(self.style.SUCCESS(result))
-        self.stdout.write(self.style.SUCCESS('Data ingestion completed!'))
\ No newline at end of file
+import json
+from django.core.management.base import BaseCommand
+from credit_app.tasks import process_data_files
+
+class Command(BaseCommand):
+    help = 'Ingest data from Excel files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the full run reports as JSON')
+        parser.add_argument('--force', action='store_true', help='Re-ingest files even if they have not changed')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting data ingestion...'))
+        reports = process_data_files(force=options['force'])
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+        else:
+            for report in reports:
+                self._write_report(report)
+        self.stdout.write(self.style.SUCCESS('Data ingestion completed!'))
+
+    def _write_report(self, report):
+        if report['status'] == 'unchanged':
+            self.stdout.write(self.style.SUCCESS(f"{report['dataset']}: file unchanged since last run, skipped"))
+            return
+        if report['status'] != 'ok':
+            self.stdout.write(self.style.ERROR(f"{report['dataset']}: {report['error']}"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['dataset']}: {report['rows_read']} rows read, {report['rows_inserted']} inserted, "
+            f"{report['rows_updated']} updated, {report['rows_unchanged']} unchanged, {report['rows_rejected']} rejected "
+            f"in {report['elapsed_seconds']}s ({report['rows_per_second']} rows/s)"
+        ))
+        phases = ', '.join(f"{phase} {seconds}s" for phase, seconds in report['phases'].items())
+        self.stdout.write(f"  phases: {phases}")
+        if report['rejected_rows_file']:
+            truncated = ' (truncated)' if report['rejected_rows_truncated'] else ''
+            self.stdout.write(self.style.WARNING(f"  rejected rows: {report['rejected_rows_file']}{truncated}"))
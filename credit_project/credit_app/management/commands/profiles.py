@@ -0,0 +1,52 @@
+import io
+import pstats
+from django.core.management.base import BaseCommand, CommandError
+from credit_app.profiling import ProfileStore
+
+class Command(BaseCommand):
+    help = 'List and summarize request profiles captured by ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'show'], help='list stored profiles or show one')
+        parser.add_argument('profile_id', nargs='?', help='Profile id (default for show: the newest)')
+        parser.add_argument('--limit', type=int, default=20, help='Rows to show per section')
+        parser.add_argument('--sort', default='cumulative', help='pstats sort key (cumulative, tottime, calls, ...)')
+
+    def handle(self, *args, **options):
+        store = ProfileStore()
+        ids = store.ids()
+        if options['action'] == 'list':
+            if not ids:
+                self.stdout.write('No profiles stored.')
+            for profile_id in ids[-options['limit']:]:
+                summary = store.load(profile_id)
+                self.stdout.write(
+                    f"{profile_id}  {summary['method']:6} {summary['path']:30} {summary['status_code']}  "
+                    f"{summary['duration_ms']:9.1f} ms  {summary['sql_count']:4} queries "
+                    f"{summary['sql_time_ms']:8.1f} ms  ({summary['trigger']})"
+                )
+            return
+
+        profile_id = options['profile_id'] or (ids[-1] if ids else None)
+        if profile_id not in ids:
+            raise CommandError(f"Profile {profile_id} not found")
+        self._show(store, profile_id, options['limit'], options['sort'])
+
+    def _show(self, store, profile_id, limit, sort):
+        summary = store.load(profile_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['method']} {summary['path']} -> {summary['status_code']} in {summary['duration_ms']} ms "
+            f"({summary['trigger']})"
+        ))
+        self.stdout.write(f"SQL: {summary['sql_count']} statements, {summary['sql_time_ms']} ms")
+
+        slowest = sorted(summary['sql'], key=lambda statement: statement['duration_ms'], reverse=True)[:limit]
+        for statement in slowest:
+            self.stdout.write(f"  {statement['duration_ms']:9.3f} ms  [{statement['alias']}] {statement['sql'][:200]}")
+        if summary['sql_statements_truncated']:
+            self.stdout.write(self.style.WARNING('  (statement list truncated)'))
+
+        self.stdout.write(f"\nTop {limit} functions by {sort}:")
+        output = io.StringIO()
+        pstats.Stats(store.stats_path(profile_id), stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(output.getvalue())
@@ -1,48 +1,48 @@
-# Generated by Django 5.2.6 on 2025-09-20 08:00
-
-import django.db.models.deletion
-import django.utils.timezone
-from django.db import migrations, models
-
-
-class Migration(migrations.Migration):
-
-    initial = True
-
-    dependencies = [
-    ]
-
-    operations = [
-        migrations.CreateModel(
-            name='Customer',
-            fields=[
-                ('customer_id', models.AutoField(primary_key=True, serialize=False)),
-                ('first_name', models.CharField(max_length=100)),
-                ('last_name', models.CharField(max_length=100)),
-                ('age', models.IntegerField()),
-                ('phone_number', models.CharField(max_length=15)),
-                ('monthly_salary', models.IntegerField()),
-                ('approved_limit', models.IntegerField()),
-                ('current_debt', models.FloatField(default=0.0)),
-                ('created_at', models.DateTimeField(auto_now_add=True)),
-                ('updated_at', models.DateTimeField(auto_now=True)),
-            ],
-        ),
-        migrations.CreateModel(
-            name='Loan',
-            fields=[
-                ('loan_id', models.AutoField(primary_key=True, serialize=False)),
-                ('loan_amount', models.FloatField()),
-                ('tenure', models.IntegerField()),
-                ('interest_rate', models.FloatField()),
-                ('monthly_repayment', models.FloatField()),
-                ('emis_paid_on_time', models.IntegerField(default=0)),
-                ('start_date', models.DateField(default=django.utils.timezone.now)),
-                ('end_date', models.DateField(blank=True, null=True)),
-                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('PAID', 'Paid')], default='PENDING', max_length=10)),
-                ('created_at', models.DateTimeField(auto_now_add=True)),
-                ('updated_at', models.DateTimeField(auto_now=True)),
-                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='credit_app.customer')),
-            ],
-        ),
-    ]
+# Generated by Django 5.2.6 on 2025-09-20 08:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('customer_id', models.AutoField(primary_key=True, serialize=False)),
+                ('first_name', models.CharField(max_length=100)),
+                ('last_name', models.CharField(max_length=100)),
+                ('age', models.IntegerField()),
+                ('phone_number', models.CharField(max_length=15)),
+                ('monthly_salary', models.IntegerField()),
+                ('approved_limit', models.IntegerField()),
+                ('current_debt', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Loan',
+            fields=[
+                ('loan_id', models.AutoField(primary_key=True, serialize=False)),
+                ('loan_amount', models.FloatField()),
+                ('tenure', models.IntegerField()),
+                ('interest_rate', models.FloatField()),
+                ('monthly_repayment', models.FloatField()),
+                ('emis_paid_on_time', models.IntegerField(default=0)),
+                ('start_date', models.DateField(default=django.utils.timezone.now)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('PAID', 'Paid')], default='PENDING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='credit_app.customer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Repayment',
+            fields=[
+                ('repayment_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('reference', models.CharField(max_length=64, unique=True)),
+                ('amount', models.FloatField()),
+                ('paid_on', models.DateField()),
+                ('paid_on_time', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='repayments', to='credit_app.loan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['loan', 'paid_on'], name='repayment_loan_paid_on_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0002_repayment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.CharField(max_length=50, unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('ingested_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
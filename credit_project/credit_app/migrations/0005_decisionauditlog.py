@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_app', '0004_shardsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DecisionAuditLog',
+            fields=[
+                ('audit_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('decision', models.CharField(choices=[('ELIGIBILITY', 'Eligibility check'), ('ORIGINATION', 'Loan origination')], max_length=20)),
+                ('customer_id', models.IntegerField()),
+                ('loan_id', models.IntegerField(blank=True, null=True)),
+                ('loan_amount', models.FloatField()),
+                ('interest_rate', models.FloatField()),
+                ('tenure', models.IntegerField()),
+                ('credit_score', models.FloatField()),
+                ('approval', models.BooleanField()),
+                ('corrected_interest_rate', models.FloatField()),
+                ('monthly_installment', models.FloatField()),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('decided_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer_id', 'decided_at'], name='audit_customer_decided_idx')],
+            },
+        ),
+    ]
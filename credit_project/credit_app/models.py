@@ -1,75 +1,213 @@
-from django.db import models
-from django.utils import timezone
-import math
-
-class Customer(models.Model):
-    customer_id = models.AutoField(primary_key=True)
-    first_name = models.CharField(max_length=100)
-    last_name = models.CharField(max_length=100)
-    age = models.IntegerField()
-    phone_number = models.CharField(max_length=15)
-    monthly_salary = models.IntegerField()
-    approved_limit = models.IntegerField()
-    current_debt = models.FloatField(default=0.0)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    
-    def __str__(self):
-        return f"{self.first_name} {self.last_name}"
-    
-    @property
-    def name(self):
-        return f"{self.first_name} {self.last_name}"
-    
-    @classmethod
-    def calculate_approved_limit(cls, monthly_salary):
-        # Approved limit = 36 * monthly_salary (rounded to nearest lakh)
-        limit = 36 * monthly_salary
-        # Round to nearest lakh (100,000)
-        return round(limit / 100000) * 100000
-
-class Loan(models.Model):
-    LOAN_STATUS_CHOICES = [
-        ('PENDING', 'Pending'),
-        ('APPROVED', 'Approved'),
-        ('REJECTED', 'Rejected'),
-        ('PAID', 'Paid'),
-    ]
-    
-    loan_id = models.AutoField(primary_key=True)
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans')
-    loan_amount = models.FloatField()
-    tenure = models.IntegerField()  # in months
-    interest_rate = models.FloatField()  # in percentage
-    monthly_repayment = models.FloatField()
-    emis_paid_on_time = models.IntegerField(default=0)
-    start_date = models.DateField(default=timezone.now)
-    end_date = models.DateField(null=True, blank=True)
-    status = models.CharField(max_length=10, choices=LOAN_STATUS_CHOICES, default='PENDING')
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    
-    def __str__(self):
-        return f"Loan {self.loan_id} - {self.customer.name}"
-    
-    @property
-    def repayments_left(self):
-        if self.status == 'PAID':
-            return 0
-        
-        months_passed = 0
-        if self.start_date:
-            today = timezone.now().date()
-            months_passed = (today.year - self.start_date.year) * 12 + today.month - self.start_date.month
-        
-        return max(0, self.tenure - months_passed)
-    
-    @classmethod
-    def calculate_monthly_installment(cls, loan_amount, interest_rate, tenure):
-        # Convert annual interest rate to monthly and decimal form
-        monthly_interest_rate = interest_rate / (12 * 100)
-        
-        # Compound interest formula for EMI calculation
-        emi = loan_amount * monthly_interest_rate * ((1 + monthly_interest_rate) ** tenure) / (((1 + monthly_interest_rate) ** tenure) - 1)
-        
-        return round(emi, 2)
+from django.db import models
+from django.utils import timezone
+import math
+import numpy as np
+
+class AddMonths(models.Func):
+    """
+    date + N months, computed in the database so end dates can be filled
+    with a single UPDATE
+    """
+    arity = 2
+    arg_joiner = ' + '
+    template = "(%(expressions)s * INTERVAL '1 month')::date"
+    output_field = models.DateField()
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite rolls Jan 31 + 1 month over to Mar 3; clamp to the month's
+        # last day like PostgreSQL and MySQL
+        (start, start_params), (months, months_params) = (
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        )
+        shifted = f"date({start}, '+' || {months} || ' months')"
+        shifted_params = (*start_params, *months_params)
+        sql = (
+            f"CASE WHEN date({shifted}, 'start of month') = date({start}, 'start of month', '+' || {months} || ' months') "
+            f"THEN {shifted} ELSE date({shifted}, 'start of month', '-1 day') END"
+        )
+        return sql, (*shifted_params, *start_params, *months_params, *shifted_params, *shifted_params)
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="DATE_ADD(%(expressions)s MONTH)",
+            arg_joiner=', INTERVAL ',
+            **extra_context
+        )
+
+class Customer(models.Model):
+    customer_id = models.AutoField(primary_key=True)
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    age = models.IntegerField()
+    phone_number = models.CharField(max_length=15)
+    monthly_salary = models.IntegerField()
+    approved_limit = models.IntegerField()
+    current_debt = models.FloatField(default=0.0)
+    source_hash = models.CharField(max_length=32, blank=True, default='')  # hash of the last ingested source row
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}"
+    
+    @property
+    def name(self):
+        return f"{self.first_name} {self.last_name}"
+    
+    @classmethod
+    def calculate_approved_limit(cls, monthly_salary):
+        # Approved limit = 36 * monthly_salary (rounded to nearest lakh)
+        limit = 36 * monthly_salary
+        # Round to nearest lakh (100,000)
+        return round(limit / 100000) * 100000
+    
+    @classmethod
+    def calculate_approved_limits(cls, monthly_salaries):
+        # Vectorized calculate_approved_limit; np.rint rounds half to even like round()
+        limits = 36 * np.asarray(monthly_salaries, dtype=np.int64)
+        return (np.rint(limits / 100000) * 100000).astype(np.int64).tolist()
+
+class Loan(models.Model):
+    LOAN_STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('APPROVED', 'Approved'),
+        ('REJECTED', 'Rejected'),
+        ('PAID', 'Paid'),
+    ]
+    
+    loan_id = models.AutoField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans')
+    loan_amount = models.FloatField()
+    tenure = models.IntegerField()  # in months
+    interest_rate = models.FloatField()  # in percentage
+    monthly_repayment = models.FloatField()
+    emis_paid_on_time = models.IntegerField(default=0)
+    start_date = models.DateField(default=timezone.now)
+    end_date = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=LOAN_STATUS_CHOICES, default='PENDING')
+    source_hash = models.CharField(max_length=32, blank=True, default='')  # hash of the last ingested source row
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Loan {self.loan_id} - {self.customer.name}"
+    
+    @property
+    def repayments_left(self):
+        return self.calculate_repayments_left(self.status, self.tenure, self.start_date)
+    
+    @classmethod
+    def calculate_repayments_left(cls, status, tenure, start_date, today=None):
+        if status == 'PAID':
+            return 0
+        
+        months_passed = 0
+        if start_date:
+            today = today or timezone.now().date()
+            months_passed = (today.year - start_date.year) * 12 + today.month - start_date.month
+        
+        return max(0, tenure - months_passed)
+    
+    @classmethod
+    def calculate_monthly_installment(cls, loan_amount, interest_rate, tenure):
+        # Convert annual interest rate to monthly and decimal form
+        monthly_interest_rate = interest_rate / (12 * 100)
+        
+        if monthly_interest_rate == 0:
+            return round(loan_amount / tenure, 2)
+        
+        # Compound interest formula for EMI calculation
+        emi = loan_amount * monthly_interest_rate * ((1 + monthly_interest_rate) ** tenure) / (((1 + monthly_interest_rate) ** tenure) - 1)
+        
+        return round(emi, 2)
+    
+    @classmethod
+    def calculate_installment_factors(cls, interest_rates, tenures):
+        """
+        EMI per unit of loan amount, vectorized over broadcastable arrays of
+        rates and tenures, so calculate_monthly_installment(amount, rate,
+        tenure) == round(amount * factor, 2) and the largest amount for a
+        given EMI is emi / factor
+        """
+        monthly_interest_rate = np.asarray(interest_rates, dtype=float) / (12 * 100)
+        tenures = np.asarray(tenures, dtype=float)
+        growth = (1 + monthly_interest_rate) ** tenures
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factors = monthly_interest_rate * growth / (growth - 1)
+        return np.where(monthly_interest_rate == 0, 1 / tenures, factors)
+
+class Repayment(models.Model):
+    """
+    Append-only ledger of EMI payments posted against a loan
+    """
+    repayment_id = models.BigAutoField(primary_key=True)
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='repayments')
+    reference = models.CharField(max_length=64, unique=True)  # servicing system payment id
+    amount = models.FloatField()
+    paid_on = models.DateField()
+    paid_on_time = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'paid_on'], name='repayment_loan_paid_on_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Repayment {self.reference} - Loan {self.loan_id}"
+
+class IngestedFile(models.Model):
+    """
+    Fingerprint of the last successfully ingested file per dataset
+    """
+    dataset = models.CharField(max_length=50, unique=True)
+    path = models.CharField(max_length=500)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    ingested_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.dataset} ({self.sha256[:12]})"
+
+class ShardSequence(models.Model):
+    """
+    Per-shard id counter used by sharding.allocate_ids
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+class DecisionAuditLog(models.Model):
+    """
+    Eligibility and origination decisions, written in batches by
+    credit_app.audit. Kept on the default database for all shards.
+    """
+    DECISION_CHOICES = [
+        ('ELIGIBILITY', 'Eligibility check'),
+        ('ORIGINATION', 'Loan origination'),
+    ]
+    
+    audit_id = models.BigAutoField(primary_key=True)
+    decision = models.CharField(max_length=20, choices=DECISION_CHOICES)
+    customer_id = models.IntegerField()
+    loan_id = models.IntegerField(null=True, blank=True)
+    loan_amount = models.FloatField()
+    interest_rate = models.FloatField()
+    tenure = models.IntegerField()
+    credit_score = models.FloatField()
+    approval = models.BooleanField()
+    corrected_interest_rate = models.FloatField()
+    monthly_installment = models.FloatField()
+    message = models.CharField(max_length=255, blank=True)
+    decided_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_id', 'decided_at'], name='audit_customer_decided_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.decision} for Customer {self.customer_id} at {self.decided_at}"
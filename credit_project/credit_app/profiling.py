@@ -0,0 +1,153 @@
+"""
+Opt-in per-request profiling
+
+A request is profiled when it carries `X-Profile: <PROFILING_TOKEN>` or is
+picked by PROFILING_SAMPLE_RATE. Each profile is a cProfile dump plus a JSON
+summary with every SQL statement and its timing, kept in a bounded
+directory that the `profiles` management command lists and summarizes.
+With no token and a zero sample rate the middleware removes itself at
+startup, so it costs nothing when profiling is off.
+"""
+import cProfile
+import hmac
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_HEADER = 'X-Profile'
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper that records each statement and its duration
+    """
+    def __init__(self, alias, max_statements):
+        self.alias = alias
+        self.max_statements = max_statements
+        self.statements = []
+        self.count = 0
+        self.total_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total_seconds += elapsed
+            if len(self.statements) < self.max_statements:
+                self.statements.append({
+                    'alias': self.alias,
+                    'sql': sql,
+                    'many': many,
+                    'duration_ms': round(elapsed * 1000, 3),
+                })
+
+class ProfileStore:
+    """
+    Directory of <id>.prof / <id>.json pairs, pruned to the newest
+    `max_entries`
+    """
+    def __init__(self, directory=None, max_entries=None):
+        self.directory = directory or settings.PROFILING_DIR
+        self.max_entries = max_entries or settings.PROFILING_MAX_ENTRIES
+
+    def new_id(self):
+        # Sortable by time, unique across workers
+        return f"{timezone.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+    def save(self, profile_id, profiler, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.directory, f'{profile_id}.prof'))
+        with open(os.path.join(self.directory, f'{profile_id}.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        self.prune()
+
+    def ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def prune(self):
+        for profile_id in self.ids()[:-self.max_entries]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def load(self, profile_id):
+        with open(os.path.join(self.directory, f'{profile_id}.json')) as f:
+            return json.load(f)
+
+    def stats_path(self, profile_id):
+        return os.path.join(self.directory, f'{profile_id}.prof')
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.token = settings.PROFILING_TOKEN
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        if not self.token and not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.store = ProfileStore()
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return self._profile(request, trigger)
+
+    def _trigger(self, request):
+        header = request.headers.get(PROFILE_HEADER)
+        if header and self.token and hmac.compare_digest(header, self.token):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def _profile(self, request, trigger):
+        profiler = cProfile.Profile()
+        recorders = [
+            QueryRecorder(alias, settings.PROFILING_MAX_STATEMENTS)
+            for alias in settings.DATABASES
+        ]
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for recorder in recorders:
+                stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this thread
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        profile_id = self.store.new_id()
+        statements = [statement for recorder in recorders for statement in recorder.statements]
+        self.store.save(profile_id, profiler, {
+            'id': profile_id,
+            'trigger': trigger,
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'sql_count': sum(recorder.count for recorder in recorders),
+            'sql_time_ms': round(sum(recorder.total_seconds for recorder in recorders) * 1000, 3),
+            'sql_statements_truncated': sum(recorder.count for recorder in recorders) > len(statements),
+            'sql': statements,
+        })
+        response['X-Profile-Id'] = profile_id
+        return response
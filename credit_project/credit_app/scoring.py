@@ -0,0 +1,156 @@
+"""
+Credit scoring and offer quotes
+
+A customer's loan history is read once with a single aggregate query
+(credit_profile) and the scoring rules are pure functions of it, so one
+request can evaluate a whole grid of offers without going back to the
+database.
+"""
+import numpy as np
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Loan
+
+# (credit score a loan is approved above, lowest interest rate it is approved at)
+APPROVAL_BANDS = [
+    (50, None),
+    (30, 12.0),
+    (10, 16.0),
+]
+
+# Sum of EMIs (existing loans plus the new one) may not exceed this share of salary
+MAX_EMI_TO_SALARY = 0.5
+
+def credit_profile(customer):
+    """
+    Aggregates of the customer's loans used by the scoring rules
+    """
+    totals = customer.loans.aggregate(
+        loan_count=Count('loan_id'),
+        total_emis=Sum('tenure'),
+        emis_paid_on_time=Sum('emis_paid_on_time'),
+        loans_this_year=Count('loan_id', filter=Q(start_date__year=timezone.now().year)),
+        current_debt=Sum('loan_amount', filter=Q(status='APPROVED')),
+        current_monthly_emi=Sum('monthly_repayment', filter=Q(status='APPROVED')),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+def calculate_history_score(customer, profile):
+    """
+    Credit score from payment history, loan count, recent activity and
+    approved volume; independent of the amount being requested
+    """
+    credit_score = 100
+    if not profile['loan_count']:
+        return credit_score
+
+    # Past loans paid on time (max impact: 40 points)
+    if profile['total_emis'] > 0:
+        on_time_ratio = min(1, profile['emis_paid_on_time'] / profile['total_emis'])
+        credit_score -= 40 * (1 - on_time_ratio)
+
+    # Number of loans taken in past (max impact: 20 points)
+    if profile['loan_count'] > 5:
+        credit_score -= 20
+    elif profile['loan_count'] > 3:
+        credit_score -= 10
+
+    # Loan activity in current year (max impact: 20 points)
+    if profile['loans_this_year'] > 3:
+        credit_score -= 20
+    elif profile['loans_this_year'] > 1:
+        credit_score -= 10
+
+    # Loan approved volume relative to salary (max impact: 20 points)
+    loan_volume_ratio = profile['current_debt'] / customer.monthly_salary
+    if loan_volume_ratio > 24:  # More than 2 years of salary
+        credit_score -= 20
+    elif loan_volume_ratio > 12:  # More than 1 year of salary
+        credit_score -= 10
+
+    return max(0, credit_score)
+
+def calculate_credit_score(customer, profile, loan_amount):
+    # If sum of current loans plus the new one > approved limit, credit score = 0
+    if profile['current_debt'] + loan_amount > customer.approved_limit:
+        return 0
+    return calculate_history_score(customer, profile)
+
+def approval_band(credit_score):
+    """
+    (approved, lowest interest rate or None) for a credit score
+    """
+    for threshold, minimum_rate in APPROVAL_BANDS:
+        if credit_score > threshold:
+            return True, minimum_rate
+    return False, None
+
+def determine_approval_and_rate(credit_score, interest_rate):
+    approved, minimum_rate = approval_band(credit_score)
+    if not approved:
+        return False, interest_rate
+    if minimum_rate is None or interest_rate > minimum_rate:
+        return True, interest_rate
+    return True, minimum_rate
+
+def exceeds_emi_limit(customer, profile, monthly_installment):
+    return profile['current_monthly_emi'] + monthly_installment > MAX_EMI_TO_SALARY * customer.monthly_salary
+
+def _exact_max_amount(customer, profile, estimate, limit_headroom, interest_rate, tenure):
+    # The EMI is rounded to paise, so the closed-form estimate can be a unit
+    # off either way; step to the largest amount the EMI rule accepts
+    def fits(amount):
+        monthly_installment = Loan.calculate_monthly_installment(amount, interest_rate, tenure)
+        return not exceeds_emi_limit(customer, profile, monthly_installment)
+
+    amount = estimate
+    while amount > 0 and not fits(amount):
+        amount -= 1
+    while amount + 1 <= limit_headroom and fits(amount + 1):
+        amount += 1
+    return amount
+
+def quote_offers(customer, profile, tenures, interest_rates):
+    """
+    Largest loan amount the customer can be approved for at every
+    tenure/rate in the grid.
+
+    A loan is approved when it keeps debt within the approved limit, keeps
+    total EMIs within MAX_EMI_TO_SALARY of salary and the credit score
+    allows it. The EMI is linear in the amount (amount * factor), so the
+    EMI rule inverts to amount <= headroom / factor; this is evaluated for
+    the whole grid at once, at the corrected rate the loan would be booked
+    at, then adjusted to the unit against the exact, rounded EMI.
+    """
+    approved, minimum_rate = approval_band(calculate_history_score(customer, profile))
+
+    rates = np.asarray(interest_rates, dtype=float)
+    if minimum_rate is not None:
+        rates = np.where(rates > minimum_rate, rates, minimum_rate)
+    rate_grid, tenure_grid = np.meshgrid(rates, np.asarray(tenures, dtype=float))
+
+    factors = Loan.calculate_installment_factors(rate_grid, tenure_grid)
+    emi_headroom = MAX_EMI_TO_SALARY * customer.monthly_salary - profile['current_monthly_emi']
+    limit_headroom = customer.approved_limit - profile['current_debt']
+    amounts = np.floor(np.clip(np.minimum(emi_headroom / factors, limit_headroom), 0, None))
+
+    offers = []
+    for row, tenure in enumerate(tenures):
+        for column, interest_rate in enumerate(interest_rates):
+            corrected_interest_rate = float(rate_grid[row, column]) if approved else interest_rate
+            amount = 0
+            if approved:
+                amount = _exact_max_amount(
+                    customer, profile, int(amounts[row, column]), limit_headroom, corrected_interest_rate, tenure
+                )
+            monthly_installment = Loan.calculate_monthly_installment(amount, corrected_interest_rate, tenure)
+            offers.append({
+                'tenure': tenure,
+                'interest_rate': interest_rate,
+                'corrected_interest_rate': corrected_interest_rate,
+                'approval': amount > 0,
+                'max_loan_amount': amount,
+                'monthly_installment': monthly_installment if amount > 0 else None,
+            })
+    return offers
@@ -1,90 +1,247 @@
-from rest_framework import serializers
-from .models import Customer, Loan
-
-class CustomerSerializer(serializers.ModelSerializer):
-    name = serializers.CharField(read_only=True)
-    
-    class Meta:
-        model = Customer
-        fields = ['customer_id', 'first_name', 'last_name', 'name', 'age', 'monthly_salary', 'approved_limit', 'phone_number']
-        read_only_fields = ['customer_id', 'approved_limit']
-
-class CustomerRegistrationSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Customer
-        fields = ['first_name', 'last_name', 'age', 'monthly_income', 'phone_number']
-    
-    monthly_income = serializers.IntegerField(write_only=True)
-    
-    def create(self, validated_data):
-        monthly_income = validated_data.pop('monthly_income')
-        approved_limit = Customer.calculate_approved_limit(monthly_income)
-        
-        customer = Customer.objects.create(
-            monthly_salary=monthly_income,
-            approved_limit=approved_limit,
-            **validated_data
-        )
-        return customer
-
-class LoanEligibilitySerializer(serializers.Serializer):
-    customer_id = serializers.IntegerField()
-    loan_amount = serializers.FloatField()
-    interest_rate = serializers.FloatField()
-    tenure = serializers.IntegerField()
-
-class LoanEligibilityResponseSerializer(serializers.Serializer):
-    customer_id = serializers.IntegerField()
-    approval = serializers.BooleanField()
-    interest_rate = serializers.FloatField()
-    corrected_interest_rate = serializers.FloatField()
-    tenure = serializers.IntegerField()
-    monthly_installment = serializers.FloatField()
-
-class LoanCreateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Loan
-        fields = ['customer_id', 'loan_amount', 'interest_rate', 'tenure']
-    
-    customer_id = serializers.IntegerField(write_only=True)
-    
-    def create(self, validated_data):
-        customer_id = validated_data.pop('customer_id')
-        customer = Customer.objects.get(customer_id=customer_id)
-        
-        loan_amount = validated_data['loan_amount']
-        interest_rate = validated_data['interest_rate']
-        tenure = validated_data['tenure']
-        
-        monthly_repayment = Loan.calculate_monthly_installment(loan_amount, interest_rate, tenure)
-        
-        loan = Loan.objects.create(
-            customer=customer,
-            monthly_repayment=monthly_repayment,
-            status='APPROVED',
-            **validated_data
-        )
-        return loan
-
-class LoanResponseSerializer(serializers.ModelSerializer):
-    loan_id = serializers.IntegerField(read_only=True)
-    customer_id = serializers.IntegerField(source='customer.customer_id', read_only=True)
-    loan_approved = serializers.BooleanField(read_only=True)
-    message = serializers.CharField(read_only=True)
-    monthly_installment = serializers.FloatField(read_only=True)
-    
-    class Meta:
-        model = Loan
-        fields = ['loan_id', 'customer_id', 'loan_approved', 'message', 'monthly_installment']
-
-class LoanDetailSerializer(serializers.ModelSerializer):
-    customer = CustomerSerializer(read_only=True)
-    
-    class Meta:
-        model = Loan
-        fields = ['loan_id', 'customer', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure']
-
-class CustomerLoanSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Loan
-        fields = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'repayments_left']
\ No newline at end of file
+from collections import defaultdict
+from operator import itemgetter
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from .models import Customer, Loan
+from .sharding import allocate_ids, run_on_shards, shard_for_customer, shard_for_new_customer
+
+class CustomerSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(read_only=True)
+    
+    class Meta:
+        model = Customer
+        fields = ['customer_id', 'first_name', 'last_name', 'name', 'age', 'monthly_salary', 'approved_limit', 'phone_number']
+        read_only_fields = ['customer_id', 'approved_limit']
+
+class CustomerRegistrationListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        """
+        Register many customers: approved limits are computed in one
+        vectorized call and rows are written with bulk_create, in one
+        transaction per shard. Returns customers in input order.
+        """
+        approved_limits = Customer.calculate_approved_limits([item['monthly_income'] for item in validated_data])
+        
+        customers = []
+        by_shard = defaultdict(list)
+        for item, approved_limit in zip(validated_data, approved_limits):
+            item = dict(item)
+            customer = Customer(
+                monthly_salary=item.pop('monthly_income'),
+                approved_limit=approved_limit,
+                **item
+            )
+            customers.append(customer)
+            by_shard[shard_for_new_customer()].append(customer)
+        
+        run_on_shards(_bulk_insert_customers, by_shard)
+        return customers
+
+def _bulk_insert_customers(alias, customers):
+    with transaction.atomic(using=alias):
+        customer_ids = allocate_ids(Customer, alias, len(customers))
+        for customer, customer_id in zip(customers, customer_ids or []):
+            customer.customer_id = customer_id
+        Customer.objects.using(alias).bulk_create(customers, batch_size=1000)
+
+class CustomerRegistrationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Customer
+        fields = ['first_name', 'last_name', 'age', 'monthly_income', 'phone_number']
+        list_serializer_class = CustomerRegistrationListSerializer
+    
+    # approved_limit is 36 * income rounded to the lakh and must fit a 32-bit integer column
+    MAX_MONTHLY_INCOME = (2 ** 31 - 1 - 50000) // 36
+    
+    monthly_income = serializers.IntegerField(write_only=True, min_value=0, max_value=MAX_MONTHLY_INCOME)
+    
+    def create(self, validated_data):
+        monthly_income = validated_data.pop('monthly_income')
+        approved_limit = Customer.calculate_approved_limit(monthly_income)
+        
+        # Pick a shard and an id that maps back to it (None: auto-increment)
+        shard = shard_for_new_customer()
+        customer_ids = allocate_ids(Customer, shard)
+        
+        customer = Customer.objects.using(shard).create(
+            customer_id=customer_ids[0] if customer_ids else None,
+            monthly_salary=monthly_income,
+            approved_limit=approved_limit,
+            **validated_data
+        )
+        return customer
+
+class LoanEligibilitySerializer(serializers.Serializer):
+    customer_id = serializers.IntegerField()
+    loan_amount = serializers.FloatField()
+    interest_rate = serializers.FloatField()
+    tenure = serializers.IntegerField()
+
+class LoanQuoteSerializer(serializers.Serializer):
+    MAX_GRID_SIZE = 50
+    # Keeps (1 + rate) ** tenure finite and the per-cell search short
+    MAX_TENURE = 600  # months
+    MAX_INTEREST_RATE = 100  # percent
+    
+    customer_id = serializers.IntegerField()
+    tenures = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_TENURE), min_length=1, max_length=MAX_GRID_SIZE
+    )
+    interest_rates = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=MAX_INTEREST_RATE), min_length=1, max_length=MAX_GRID_SIZE
+    )
+
+class LoanEligibilityResponseSerializer(serializers.Serializer):
+    customer_id = serializers.IntegerField()
+    approval = serializers.BooleanField()
+    interest_rate = serializers.FloatField()
+    corrected_interest_rate = serializers.FloatField()
+    tenure = serializers.IntegerField()
+    monthly_installment = serializers.FloatField()
+
+class LoanCreateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Loan
+        fields = ['customer_id', 'loan_amount', 'interest_rate', 'tenure']
+    
+    customer_id = serializers.IntegerField(write_only=True)
+    
+    def create(self, validated_data):
+        customer_id = validated_data.pop('customer_id')
+        shard = shard_for_customer(customer_id)
+        customer = Customer.objects.using(shard).get(customer_id=customer_id)
+        
+        loan_amount = validated_data['loan_amount']
+        interest_rate = validated_data['interest_rate']
+        tenure = validated_data['tenure']
+        
+        monthly_repayment = Loan.calculate_monthly_installment(loan_amount, interest_rate, tenure)
+        
+        loan_ids = allocate_ids(Loan, shard)
+        loan = Loan.objects.using(shard).create(
+            loan_id=loan_ids[0] if loan_ids else None,
+            customer=customer,
+            monthly_repayment=monthly_repayment,
+            status='APPROVED',
+            **validated_data
+        )
+        return loan
+
+class LoanResponseSerializer(serializers.ModelSerializer):
+    loan_id = serializers.IntegerField(read_only=True)
+    customer_id = serializers.IntegerField(source='customer.customer_id', read_only=True)
+    loan_approved = serializers.BooleanField(read_only=True)
+    message = serializers.CharField(read_only=True)
+    monthly_installment = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = Loan
+        fields = ['loan_id', 'customer_id', 'loan_approved', 'message', 'monthly_installment']
+
+class LoanDetailSerializer(serializers.ModelSerializer):
+    customer = CustomerSerializer(read_only=True)
+    
+    class Meta:
+        model = Loan
+        fields = ['loan_id', 'customer', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure']
+
+class CustomerLoanSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Loan
+        fields = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'repayments_left']
+
+class RepaymentSerializer(serializers.Serializer):
+    reference = serializers.CharField(max_length=64)
+    loan_id = serializers.IntegerField()
+    amount = serializers.FloatField(min_value=0)
+    paid_on = serializers.DateField()
+    paid_on_time = serializers.BooleanField(default=True)
+
+def _field_renderer(get, to_representation):
+    if to_representation is None:
+        return get
+    
+    def render(row):
+        value = get(row)
+        # DRF fields render None as-is without calling to_representation
+        return None if value is None else to_representation(value)
+    return render
+
+class ValuesRowSerializer:
+    """
+    Read-only fast path that renders QuerySet.values() rows instead of model
+    instances. `fields` mirrors the ModelSerializer it replaces, in the same
+    order, as (key, source, to_representation); `source` is a values() column
+    or the name of a `get_<key>` method taking the row. The output is
+    identical to the ModelSerializer's.
+    """
+    fields = ()
+    extra_sources = ()
+    
+    def __init__(self):
+        self.sources = [source for _, source, _ in self.fields if not source.startswith('get_')]
+        self.sources.extend(self.extra_sources)
+        # (key, row -> value), resolved once rather than per row
+        self._renderers = tuple(
+            (key, _field_renderer(
+                getattr(self, source) if source.startswith('get_') else itemgetter(source), to_representation
+            ))
+            for key, source, to_representation in self.fields
+        )
+    
+    def to_representation(self, row):
+        return {key: render(row) for key, render in self._renderers}
+    
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+class CustomerRowSerializer(ValuesRowSerializer):
+    """Fast path for CustomerSerializer nested under a loan (customer__ columns)"""
+    fields = (
+        ('customer_id', 'customer__customer_id', int),
+        ('first_name', 'customer__first_name', str),
+        ('last_name', 'customer__last_name', str),
+        ('name', 'get_name', str),
+        ('age', 'customer__age', int),
+        ('monthly_salary', 'customer__monthly_salary', int),
+        ('approved_limit', 'customer__approved_limit', int),
+        ('phone_number', 'customer__phone_number', str),
+    )
+    
+    def get_name(self, row):
+        return f"{row['customer__first_name']} {row['customer__last_name']}"
+
+class LoanDetailRowSerializer(ValuesRowSerializer):
+    """Fast path for LoanDetailSerializer"""
+    customer = CustomerRowSerializer()
+    fields = (
+        ('loan_id', 'loan_id', int),
+        ('customer', 'get_customer', None),
+        ('loan_amount', 'loan_amount', float),
+        ('interest_rate', 'interest_rate', float),
+        ('monthly_repayment', 'monthly_repayment', float),
+        ('tenure', 'tenure', int),
+    )
+    extra_sources = customer.sources
+    
+    def get_customer(self, row):
+        return self.customer.to_representation(row)
+
+class CustomerLoanRowSerializer(ValuesRowSerializer):
+    """Fast path for CustomerLoanSerializer"""
+    fields = (
+        ('loan_id', 'loan_id', int),
+        ('loan_amount', 'loan_amount', float),
+        ('interest_rate', 'interest_rate', float),
+        ('monthly_repayment', 'monthly_repayment', float),
+        ('repayments_left', 'get_repayments_left', None),
+    )
+    extra_sources = ('status', 'tenure', 'start_date')
+    
+    def __init__(self):
+        super().__init__()
+        self.today = timezone.now().date()
+    
+    def get_repayments_left(self, row):
+        return Loan.calculate_repayments_left(row['status'], row['tenure'], row['start_date'], self.today)
@@ -0,0 +1,169 @@
+"""
+Customer-id sharding
+
+Every customer and their loans/repayments live on one database alias,
+CREDIT_SHARDS[customer_id % len(CREDIT_SHARDS)]. With a single shard (the
+default) everything resolves to 'default' and ids come from the database's
+own auto-increment, so the rest of the app behaves exactly as unsharded.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+
+# Models that are stored per shard; everything else stays on 'default'
+SHARDED_MODELS = {'customer', 'loan', 'repayment', 'shardsequence'}
+
+class ShardConflict(RuntimeError):
+    """
+    The same primary key is stored on more than one shard
+    """
+
+def shard_aliases():
+    return settings.CREDIT_SHARDS
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+def shard_for_customer(customer_id):
+    aliases = shard_aliases()
+    return aliases[int(customer_id) % len(aliases)]
+
+def shard_for_loan(loan_id):
+    """
+    Shard a loan id was allocated on. Loans ingested with ids from a file
+    may live elsewhere; see find_loan_shard.
+    """
+    aliases = shard_aliases()
+    return aliases[int(loan_id) % len(aliases)]
+
+def shard_for_new_customer():
+    return random.choice(shard_aliases())
+
+def allocate_ids(model, alias, count=1):
+    """
+    Reserve `count` primary keys on `alias` that map back to it
+    (id % shard count == shard index) and are above every id stored on any
+    shard, since ingested rows keep their file ids and may live on a shard
+    their id does not map to. Returns None with a single shard, where the
+    database's auto-increment is used instead.
+    """
+    from .models import ShardSequence
+
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return None
+
+    shards = len(aliases)
+    index = aliases.index(alias)
+    name = model._meta.label_lower
+    pk = model._meta.pk.name
+    with transaction.atomic(using=alias):
+        # Never hand out an id below one that was inserted explicitly (e.g. by ingestion)
+        top = max(model.objects.using(shard).aggregate(top=Max(pk))['top'] or 0 for shard in aliases)
+        floor = top // shards
+        ShardSequence.objects.using(alias).get_or_create(name=name)
+        ShardSequence.objects.using(alias).filter(name=name).update(
+            last_value=Greatest(F('last_value'), floor) + count
+        )
+        last = ShardSequence.objects.using(alias).values_list('last_value', flat=True).get(name=name)
+    return [block * shards + index for block in range(last - count + 1, last + 1)]
+
+def run_on_shards(func, work):
+    """
+    Call func(alias, item) for every alias -> item in `work`, one thread per
+    shard, and return {alias: result}. A single shard, or any number with
+    CREDIT_PARALLEL_SHARDS off, runs inline so it shares the caller's
+    connections and transactions.
+    """
+    if len(work) <= 1 or not settings.CREDIT_PARALLEL_SHARDS:
+        return {alias: func(alias, item) for alias, item in work.items()}
+
+    def call(alias, item):
+        try:
+            return func(alias, item)
+        finally:
+            # Worker threads open their own connections; don't leak them
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(work)) as executor:
+        futures = {alias: executor.submit(call, alias, item) for alias, item in work.items()}
+        return {alias: future.result() for alias, future in futures.items()}
+
+def run_on_all_shards(func):
+    """
+    Call func(alias) on every shard in parallel; returns {alias: result}
+    """
+    return run_on_shards(lambda alias, _: func(alias), {alias: None for alias in shard_aliases()})
+
+def find_loan_shards(loan_ids):
+    """
+    {loan_id: alias} for the ids found on any shard. Raises ShardConflict
+    if an id is stored on more than one shard. With a single shard every
+    id maps to 'default' without a query, whether it exists or not.
+    """
+    from .models import Loan
+
+    loan_ids = [int(loan_id) for loan_id in loan_ids]
+    if not is_sharded():
+        return {loan_id: 'default' for loan_id in loan_ids}
+    shards = {}
+    for alias in shard_aliases():
+        for start in range(0, len(loan_ids), 500):
+            chunk = loan_ids[start:start + 500]
+            for loan_id in Loan.objects.using(alias).filter(loan_id__in=chunk).values_list('loan_id', flat=True):
+                if loan_id in shards:
+                    raise ShardConflict(f"Loan {loan_id} exists on both {shards[loan_id]} and {alias}")
+                shards[loan_id] = alias
+    return shards
+
+def find_loan_shard(loan_id):
+    """
+    Alias holding `loan_id`, or None. Every shard is checked, so an id
+    stored twice raises ShardConflict instead of resolving to either copy.
+    Unsharded, this is 'default' without a query.
+    """
+    if not is_sharded():
+        return 'default'
+    return find_loan_shards([loan_id]).get(int(loan_id))
+
+class ShardRouter:
+    """
+    Routes writes of sharded models by their customer id (or the database
+    they were loaded from). Reads are routed explicitly with .using() or
+    through related managers, which carry the instance hint.
+    """
+    def _is_sharded(self, model):
+        return model._meta.app_label == 'credit_app' and model._meta.model_name in SHARDED_MODELS
+
+    def _db_for(self, model, **hints):
+        if not self._is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        customer_id = getattr(instance, 'customer_id', None)
+        if customer_id is not None:
+            return shard_for_customer(customer_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_sharded(type(obj1)) and self._is_sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or db not in shard_aliases():
+            return None
+        return app_label == 'credit_app' and (model_name is None or model_name in SHARDED_MODELS)
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .analytics import invalidate_portfolio_exposure
+from .models import Customer, Loan
+
+@receiver([post_save, post_delete], sender=Loan)
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_exposure_cache(sender, **kwargs):
+    invalidate_portfolio_exposure()
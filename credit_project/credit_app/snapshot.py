@@ -0,0 +1,238 @@
+"""
+Columnar snapshots of the customer/loan portfolio for analytics
+
+Each snapshot is a directory of NumPy .npy files (one per column) plus a
+manifest. Readers open the columns with memory-mapping, so ad-hoc analysis
+runs against the files instead of the production database.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Customer, Loan
+from .sharding import run_on_all_shards
+
+LOAN_STATUSES = [code for code, _ in Loan.LOAN_STATUS_CHOICES]
+
+CUSTOMER_COLUMNS = {
+    'customer_id': 'int64',
+    'age': 'int32',
+    'monthly_salary': 'int64',
+    'approved_limit': 'int64',
+    'current_debt': 'float64',
+}
+
+LOAN_COLUMNS = {
+    'loan_id': 'int64',
+    'customer_id': 'int64',
+    'loan_amount': 'float64',
+    'tenure': 'int32',
+    'interest_rate': 'float64',
+    'monthly_repayment': 'float64',
+    'emis_paid_on_time': 'int32',
+    'start_date': 'datetime64[D]',
+    'end_date': 'datetime64[D]',
+    'status': 'int8',
+}
+
+CURRENT_POINTER = 'CURRENT'
+MANIFEST = 'manifest.json'
+
+def _read_shard(alias):
+    # Customers and loans of one shard from the same database snapshot, so
+    # every loan read has its customer read too
+    connection = connections[alias]
+    # The isolation level can only be set as a transaction's first statement
+    repeatable_read = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic(using=alias):
+        if repeatable_read:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        return {
+            model: list(model.objects.using(alias).values_list(*columns).iterator(chunk_size=10000))
+            for model, columns in ((Customer, list(CUSTOMER_COLUMNS)), (Loan, list(LOAN_COLUMNS)))
+        }
+
+def _merge_columns(shard_rows, model, columns):
+    # Merge the shards in primary key order (the first column)
+    rows = sorted((row for rows in shard_rows for row in rows[model]), key=lambda row: row[0])
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return dict(zip(columns, values))
+
+def _to_arrays(raw, dtypes):
+    arrays = {}
+    for name, dtype in dtypes.items():
+        values = raw[name]
+        if name == 'status':
+            codes = {status: code for code, status in enumerate(LOAN_STATUSES)}
+            values = [codes[value] for value in values]
+        # None -> NaT for the date columns
+        arrays[name] = np.array(values, dtype=dtype)
+    return arrays
+
+def write_snapshot(directory=None, keep=None):
+    """
+    Write a new snapshot under `directory` and make it the current one
+    """
+    directory = directory or settings.SNAPSHOT_DIR
+    keep = keep or settings.SNAPSHOT_KEEP
+    os.makedirs(directory, exist_ok=True)
+
+    created_at = timezone.now()
+    name = created_at.strftime('%Y%m%dT%H%M%S%f')
+
+    shard_rows = list(run_on_all_shards(_read_shard).values())
+    customers = _to_arrays(
+        _merge_columns(shard_rows, Customer, list(CUSTOMER_COLUMNS)),
+        CUSTOMER_COLUMNS
+    )
+    loans = _to_arrays(
+        _merge_columns(shard_rows, Loan, list(LOAN_COLUMNS)),
+        LOAN_COLUMNS
+    )
+    # Row index into the customer columns, so loans can be joined to
+    # customer attributes with a single gather. Loans whose customer is not
+    # in the snapshot are dropped rather than pointed at the wrong row.
+    customer_index = np.searchsorted(customers['customer_id'], loans['customer_id'])
+    in_range = customer_index < len(customers['customer_id'])
+    matched = in_range.copy()
+    matched[in_range] = customers['customer_id'][customer_index[in_range]] == loans['customer_id'][in_range]
+    loans = {name: values[matched] for name, values in loans.items()}
+    loans['customer_index'] = customer_index[matched].astype('int64')
+    dropped_loans = int((~matched).sum())
+
+    # Staged only once the reads succeeded, and removed again if writing
+    # fails, so an aborted run leaves nothing behind in `directory`
+    staging = os.path.join(directory, f'.{name}.tmp')
+    os.makedirs(staging)
+    try:
+        for table, columns in (('customers', customers), ('loans', loans)):
+            os.makedirs(os.path.join(staging, table))
+            for column, values in columns.items():
+                np.save(os.path.join(staging, table, f'{column}.npy'), values)
+
+        manifest = {
+            'name': name,
+            'created_at': created_at.isoformat(),
+            'loan_statuses': LOAN_STATUSES,
+            'tables': {
+                'customers': {'rows': len(customers['customer_id']), 'columns': list(customers)},
+                'loans': {'rows': len(loans['loan_id']), 'columns': list(loans)},
+            },
+            'loans_without_customer': dropped_loans,
+        }
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    os.rename(staging, os.path.join(directory, name))
+
+    # Swap the pointer atomically so readers never see a half-written snapshot
+    pointer_tmp = os.path.join(directory, f'.{CURRENT_POINTER}.tmp')
+    with open(pointer_tmp, 'w') as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_POINTER))
+
+    snapshots = sorted(
+        entry for entry in os.listdir(directory)
+        if not entry.startswith('.') and entry != CURRENT_POINTER
+    )
+    for stale in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(directory, stale), ignore_errors=True)
+
+    return manifest
+
+class SnapshotTable:
+    """
+    A set of equal-length columns with vectorized filtering and grouping
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def where(self, mask):
+        """
+        Rows where the boolean `mask` is true (copies only the selected rows)
+        """
+        return SnapshotTable({name: values[mask] for name, values in self.columns.items()})
+
+    def group_by(self, key, **aggregations):
+        """
+        Group rows by `key` (a column name or an array) and aggregate.
+
+        Each aggregation is `(column, func)` with func one of sum, mean,
+        count, min or max, e.g.
+        `loans.group_by('tenure', exposure=('loan_amount', 'sum'))`
+        """
+        keys = self.columns[key] if isinstance(key, str) else np.asarray(key)
+        groups, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(groups))
+
+        result = {'key': groups}
+        for name, (column, func) in aggregations.items():
+            values = self.columns[column] if isinstance(column, str) else np.asarray(column)
+            if func == 'count':
+                result[name] = counts
+            elif func == 'sum':
+                result[name] = np.bincount(inverse, weights=values, minlength=len(groups))
+            elif func == 'mean':
+                sums = np.bincount(inverse, weights=values, minlength=len(groups))
+                result[name] = sums / np.maximum(counts, 1)
+            elif func in ('min', 'max'):
+                ufunc = np.minimum if func == 'min' else np.maximum
+                out = np.full(len(groups), values[0] if len(values) else 0, dtype=values.dtype)
+                ufunc.at(out, inverse, values)
+                result[name] = out
+            else:
+                raise ValueError(f"Unsupported aggregation: {func}")
+        return result
+
+class PortfolioSnapshot:
+    """
+    Read-only view of a snapshot; columns are memory-mapped, not loaded
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.customers = self._open_table('customers')
+        self.loans = self._open_table('loans')
+
+    @classmethod
+    def open(cls, directory=None):
+        """
+        Open the current snapshot under `directory`
+        """
+        directory = directory or settings.SNAPSHOT_DIR
+        with open(os.path.join(directory, CURRENT_POINTER)) as f:
+            name = f.read().strip()
+        return cls(os.path.join(directory, name))
+
+    def _open_table(self, table):
+        columns = self.manifest['tables'][table]['columns']
+        return SnapshotTable({
+            column: np.load(os.path.join(self.path, table, f'{column}.npy'), mmap_mode='r')
+            for column in columns
+        })
+
+    def status_code(self, status):
+        return self.manifest['loan_statuses'].index(status)
+
+    def loan_customer_column(self, column, loans=None):
+        """
+        Customer attribute aligned with each loan row
+        """
+        loans = loans if loans is not None else self.loans
+        return self.customers[column][loans['customer_index']]
@@ -1,132 +1,464 @@
-import os
-import pandas as pd
-from celery import shared_task
-from django.utils import timezone
-from datetime import datetime
-from .models import Customer, Loan
-
-@shared_task
-def ingest_customer_data(file_path):
-    """
-    Ingest customer data from Excel file into the database
-    """
-    try:
-        # Read Excel file
-        df = pd.read_excel(file_path)
-        
-        # Process each row
-        for _, row in df.iterrows():
-            # Check if customer already exists
-            customer_id = row.get('customer_id')
-            if customer_id and Customer.objects.filter(customer_id=customer_id).exists():
-                continue
-            
-            # Create new customer
-            Customer.objects.create(
-                customer_id=customer_id if customer_id else None,  # Allow auto-increment if not provided
-                first_name=row.get('first_name', ''),
-                last_name=row.get('last_name', ''),
-                age=row.get('age', 0),  # Default age to 0 if missing
-                phone_number=str(row.get('phone_number', '')),
-                monthly_salary=row.get('monthly_salary', 0),
-                approved_limit=row.get('approved_limit', 0),
-                current_debt=row.get('current_debt', 0.0)
-            )
-        
-        return f"Successfully ingested {len(df)} customer records"
-    except Exception as e:
-        return f"Error ingesting customer data: {str(e)}"
-
-@shared_task
-def ingest_loan_data(file_path):
-    """
-    Ingest loan data from Excel file into the database
-    """
-    try:
-        # Read Excel file
-        df = pd.read_excel(file_path)
-        
-        # Process each row
-        success_count = 0
-        error_count = 0
-        
-        for _, row in df.iterrows():
-            try:
-                # Get customer
-                customer_id = row.get('customer_id')
-                try:
-                    customer = Customer.objects.get(customer_id=customer_id)
-                except Customer.DoesNotExist:
-                    error_count += 1
-                    continue
-                
-                # Check if loan already exists
-                loan_id = row.get('loan_id')
-                if loan_id and Loan.objects.filter(loan_id=loan_id).exists():
-                    continue
-                
-                # Parse dates
-                start_date = None
-                if 'start_date' in row and pd.notna(row['start_date']):
-                    if isinstance(row['start_date'], str):
-                        start_date = datetime.strptime(row['start_date'], '%Y-%m-%d').date()
-                    else:
-                        start_date = row['start_date'].date() if hasattr(row['start_date'], 'date') else None
-                
-                end_date = None
-                if 'end_date' in row and pd.notna(row['end_date']):
-                    if isinstance(row['end_date'], str):
-                        end_date = datetime.strptime(row['end_date'], '%Y-%m-%d').date()
-                    else:
-                        end_date = row['end_date'].date() if hasattr(row['end_date'], 'date') else None
-                
-                # Create new loan
-                Loan.objects.create(
-                    loan_id=loan_id if loan_id else None,  # Allow auto-increment if not provided
-                    customer=customer,
-                    loan_amount=row.get('loan_amount', 0.0),
-                    tenure=row.get('tenure', 0),
-                    interest_rate=row.get('interest_rate', 0.0),
-                    monthly_repayment=row.get('monthly_repayment', 0.0),
-                    emis_paid_on_time=row.get('EMIs_paid_on_time', 0),
-                    start_date=start_date,
-                    end_date=end_date,
-                    status='APPROVED'  # Assuming all imported loans are approved
-                )
-                
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                continue
-        
-        return f"Successfully ingested {success_count} loan records. Errors: {error_count}"
-    except Exception as e:
-        return f"Error ingesting loan data: {str(e)}"
-
-@shared_task
-def process_data_files():
-    """
-    Process both customer and loan data files
-    """
-    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    
-    # Define file paths
-    customer_file = os.path.join(base_dir, 'data', 'customer_data.xlsx')
-    loan_file = os.path.join(base_dir, 'data', 'loan_data.xlsx')
-    
-    # Process files if they exist
-    results = []
-    
-    if os.path.exists(customer_file):
-        result = ingest_customer_data(customer_file)
-        results.append(result)
-    else:
-        results.append(f"Customer data file not found at {customer_file}")
-    
-    if os.path.exists(loan_file):
-        result = ingest_loan_data(loan_file)
-        results.append(result)
-    else:
-        results.append(f"Loan data file not found at {loan_file}")
-    
-    return results
\ No newline at end of file
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from celery import shared_task
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+from datetime import date
+from .analytics import invalidate_portfolio_exposure
+from .ingestion import (
+    IngestionReport, RowError, field_error, file_fingerprint, missing_file_report,
+    parse_date, parse_int, parse_phone, parse_value, read_frame, row_hash
+)
+from .models import AddMonths, Customer, IngestedFile, Loan, Repayment
+from .sharding import (
+    allocate_ids, find_loan_shards, run_on_all_shards, run_on_shards,
+    shard_aliases, shard_for_customer, shard_for_new_customer
+)
+from .snapshot import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Rows per bulk INSERT / ids per IN (...) clause
+BATCH_SIZE = 500
+
+def _chunked(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _existing_ids(model, field, ids, using='default'):
+    existing = set()
+    for chunk in _chunked(list(ids)):
+        existing.update(model.objects.using(using).filter(**{f'{field}__in': chunk}).values_list(field, flat=True))
+    return existing
+
+def _stored_hashes(model, field, ids, using='default'):
+    stored = {}
+    for chunk in _chunked(list(ids)):
+        stored.update(model.objects.using(using).filter(**{f'{field}__in': chunk}).values_list(field, 'source_hash'))
+    return stored
+
+def _reset_sequences(*models, using='default'):
+    # Rows inserted with explicit ids do not advance PostgreSQL sequences
+    connection = connections[using]
+    sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sql:
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+
+def _customer_from_row(row):
+    return {
+        'customer_id': parse_value(row, 'customer_id', parse_int),
+        'first_name': parse_value(row, 'first_name', str, ''),
+        'last_name': parse_value(row, 'last_name', str, ''),
+        'age': parse_value(row, 'age', parse_int, 0),
+        'phone_number': parse_value(row, 'phone_number', parse_phone, ''),
+        'monthly_salary': parse_value(row, 'monthly_salary', parse_int, 0),
+        'approved_limit': parse_value(row, 'approved_limit', parse_int, 0),
+        'current_debt': parse_value(row, 'current_debt', float, 0.0),
+    }
+
+def _loan_from_row(row):
+    return {
+        'loan_id': parse_value(row, 'loan_id', parse_int),
+        'customer_id': parse_value(row, 'customer_id', parse_int),
+        'loan_amount': parse_value(row, 'loan_amount', float, 0.0),
+        'tenure': parse_value(row, 'tenure', parse_int, 0),
+        'interest_rate': parse_value(row, 'interest_rate', float, 0.0),
+        'monthly_repayment': parse_value(row, 'monthly_repayment', float, 0.0),
+        'emis_paid_on_time': parse_value(row, 'emis_paid_on_time', parse_int, 0),
+        'start_date': parse_value(row, 'start_date', parse_date),
+        'end_date': parse_value(row, 'end_date', parse_date),
+    }
+
+def _check_customers(records, using):
+    def check(record):
+        if record['monthly_salary'] < 0:
+            return "Negative monthly_salary"
+    return check
+
+def _check_loans(records, using):
+    known_customers = _existing_ids(
+        Customer, 'customer_id',
+        {record['customer_id'] for _, _, record in records if record['customer_id']},
+        using=using
+    )
+    
+    # Loan ids must be unique across shards; these rows go to their customer's
+    loan_ids = {record['loan_id'] for _, _, record in records if record['loan_id']}
+    elsewhere = {}
+    for alias in shard_aliases():
+        if alias != using:
+            elsewhere.update((loan_id, alias) for loan_id in _existing_ids(Loan, 'loan_id', loan_ids, using=alias))
+    
+    def check(record):
+        if record['customer_id'] not in known_customers:
+            return f"Unknown customer_id {record['customer_id']}"
+        if record['loan_id'] in elsewhere:
+            return f"loan_id {record['loan_id']} already exists on {elsewhere[record['loan_id']]}"
+        if record['start_date'] is None:
+            return "Missing start_date"
+    return check
+
+def _transform(report, df, parse_row):
+    records = []
+    # Spreadsheet row numbers: the header is row 1
+    for row_number, row in enumerate(df.to_dict('records'), start=2):
+        try:
+            records.append((row_number, row, parse_row(row)))
+        except RowError as e:
+            report.reject(row_number, str(e), row)
+    return records
+
+def _diff_shard(alias, model, records, check_rows, insert_defaults):
+    """
+    Validate one shard's rows against the model's field constraints and
+    the dataset checks, then classify them against the stored source
+    hashes. Returns (rows to upsert, counts, rejected rows).
+    """
+    pk = model._meta.pk.name
+    stored = _stored_hashes(model, pk, {record[pk] for _, _, record in records if record[pk]}, using=alias)
+    check = check_rows(records, alias)
+    counts = Counter()
+    rejects = []
+    upserts = []
+    for row_number, row, record in records:
+        key = record[pk]
+        reason = field_error(model, record) or check(record)
+        if reason:
+            rejects.append((row_number, reason, row))
+            continue
+        
+        record['source_hash'] = row_hash(record)
+        if key in stored:
+            if stored[key] == record['source_hash']:
+                counts['unchanged'] += 1
+                continue
+            counts['updated'] += 1
+        else:
+            counts['inserted'] += 1
+        # Allow auto-increment if no id was provided
+        record[pk] = key or None
+        upserts.append(model(**(insert_defaults or {}), **record))
+    return upserts, counts, rejects
+
+def _write_shard(alias, model, upserts, update_fields):
+    pk = model._meta.pk.name
+    with transaction.atomic(using=alias):
+        # Rows without an id get one that maps back to this shard
+        missing = [obj for obj in upserts if obj.pk is None]
+        ids = allocate_ids(model, alias, len(missing)) if missing else None
+        for obj, allocated in zip(missing, ids or []):
+            obj.pk = allocated
+        model.objects.using(alias).bulk_create(
+            upserts, batch_size=BATCH_SIZE,
+            update_conflicts=True, unique_fields=[pk], update_fields=update_fields
+        )
+        _reset_sequences(model, using=alias)
+    return len(upserts)
+
+def _ingest_file(dataset, file_path, model, parse_row, check_rows, insert_defaults=None,
+                 insert_only_fields=(), force=False):
+    """
+    Incrementally ingest one file: skip it entirely if its fingerprint is
+    unchanged, otherwise diff each row's hash against the stored
+    source_hash and upsert only inserted/changed rows. Rows are split by
+    customer shard and each shard is diffed and written in parallel. The
+    fingerprint is only saved when no row was rejected.
+    
+    Columns in `insert_only_fields` are taken from the file for new rows
+    only; updates keep the stored value.
+    """
+    pk = model._meta.pk.name
+    report = IngestionReport(dataset, file_path)
+    try:
+        with report.phase('fingerprint'):
+            sha256, size = file_fingerprint(file_path)
+            previous = IngestedFile.objects.filter(dataset=dataset).first()
+        if previous and previous.sha256 == sha256 and not force:
+            report.file_unchanged()
+            return report.finish()
+        
+        with report.phase('read'):
+            df = read_frame(file_path)
+        report.counts['read'] = len(df)
+        
+        with report.phase('transform'):
+            records = _transform(report, df, parse_row)
+        
+        with report.phase('validate'):
+            fields = list(records[0][2]) if records else []
+            seen = set()
+            by_shard = defaultdict(list)
+            for row_number, row, record in records:
+                key = record[pk]
+                if key and key in seen:
+                    report.reject(row_number, f"Duplicate {pk} {key} in file", row)
+                    continue
+                seen.add(key)
+                customer_id = record.get('customer_id')
+                shard = shard_for_customer(customer_id) if customer_id else shard_for_new_customer()
+                by_shard[shard].append((row_number, row, record))
+            
+            diffs = run_on_shards(
+                lambda alias, shard_records: _diff_shard(alias, model, shard_records, check_rows, insert_defaults),
+                by_shard
+            )
+            upserts = {}
+            for alias, (shard_upserts, counts, rejects) in diffs.items():
+                upserts[alias] = shard_upserts
+                for name, count in counts.items():
+                    report.counts[name] += count
+                for row_number, reason, row in rejects:
+                    report.reject(row_number, reason, row)
+            
+            # Updates only touch columns present in the file, so values the
+            # application maintains (e.g. current_debt) are not reset to defaults
+            update_fields = [
+                field for field in fields
+                if field in df.columns and field != pk and field not in insert_only_fields
+            ] + ['source_hash', 'updated_at']
+        
+        with report.phase('write'):
+            run_on_shards(
+                lambda alias, shard_upserts: _write_shard(alias, model, shard_upserts, update_fields),
+                upserts
+            )
+            # A file with rejected rows is read again next run: those rows may
+            # pass once what they depend on (e.g. their customer) is fixed
+            if not report.counts['rejected']:
+                IngestedFile.objects.update_or_create(
+                    dataset=dataset,
+                    defaults={'path': file_path, 'sha256': sha256, 'size': size}
+                )
+    except Exception as e:
+        logger.exception("%s ingestion from %s failed", dataset, file_path)
+        report.fail(e)
+    
+    return report.finish()
+
+@shared_task
+def ingest_customer_data(file_path, force=False):
+    """
+    Ingest customer data from Excel file into the database and return a
+    structured run report
+    """
+    return _ingest_file('customers', file_path, Customer, _customer_from_row, _check_customers, force=force)
+
+@shared_task
+def ingest_loan_data(file_path, force=False):
+    """
+    Ingest loan data from Excel file into the database and return a
+    structured run report.
+    
+    "EMIs paid on Time" seeds emis_paid_on_time for new loans only; for
+    loans already stored the repayment ledger maintains that counter, so a
+    changed row never resets it to the spreadsheet value.
+    """
+    # Assuming all imported loans are approved
+    return _ingest_file(
+        'loans', file_path, Loan, _loan_from_row, _check_loans,
+        insert_defaults={'status': 'APPROVED'}, insert_only_fields=('emis_paid_on_time',), force=force
+    )
+
+@shared_task
+def process_data_files(force=False):
+    """
+    Process both customer and loan data files and return one run report
+    per file. Files whose contents have not changed since the last run are
+    skipped unless `force` is set.
+    """
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    
+    # Define file paths
+    customer_file = os.path.join(base_dir, 'data', 'customer_data.xlsx')
+    loan_file = os.path.join(base_dir, 'data', 'loan_data.xlsx')
+    
+    # Process files if they exist
+    results = []
+    
+    if os.path.exists(customer_file):
+        results.append(ingest_customer_data(customer_file, force=force))
+    else:
+        results.append(missing_file_report('customers', customer_file))
+    
+    if os.path.exists(loan_file):
+        results.append(ingest_loan_data(loan_file, force=force))
+    else:
+        results.append(missing_file_report('loans', loan_file))
+    
+    # Bulk loads bypass model signals
+    invalidate_portfolio_exposure()
+    
+    return results
+
+def _post_shard_repayments(alias, by_reference):
+    with transaction.atomic(using=alias):
+        # Lock the loans so concurrent posts of the same payments run one after the other
+        loan_ids = list({int(payment['loan_id']) for payment in by_reference.values()})
+        known_loans = set()
+        for chunk in _chunked(loan_ids):
+            known_loans.update(
+                Loan.objects.using(alias).select_for_update().filter(loan_id__in=chunk).values_list('pk', flat=True)
+            )
+        unknown_loans = [
+            reference for reference, payment in by_reference.items() if int(payment['loan_id']) not in known_loans
+        ]
+        
+        already_posted = _existing_ids(Repayment, 'reference', by_reference, using=alias)
+        
+        ledger = []
+        for reference, payment in by_reference.items():
+            if reference in already_posted or int(payment['loan_id']) not in known_loans:
+                continue
+            
+            paid_on = payment['paid_on']
+            if isinstance(paid_on, str):
+                paid_on = date.fromisoformat(paid_on)
+            
+            ledger.append(Repayment(
+                loan_id=int(payment['loan_id']),
+                reference=reference,
+                amount=payment['amount'],
+                paid_on=paid_on,
+                paid_on_time=bool(payment.get('paid_on_time', True))
+            ))
+        
+        # A reference posted concurrently against another loan (not covered by
+        # the lock) is skipped rather than failing the batch, and not counted
+        Repayment.objects.using(alias).bulk_create(ledger, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        stored_loans = {}
+        for chunk in _chunked([repayment.reference for repayment in ledger]):
+            stored_loans.update(
+                Repayment.objects.using(alias).filter(reference__in=chunk).values_list('reference', 'loan_id')
+            )
+        inserted = [repayment for repayment in ledger if stored_loans.get(repayment.reference) == repayment.loan_id]
+        
+        on_time_counts = Counter(repayment.loan_id for repayment in inserted if repayment.paid_on_time)
+        
+        # One UPDATE per distinct increment rather than one per loan; a daily
+        # file normally carries a single EMI per loan so this is one statement.
+        # The counter never exceeds the loan's tenure.
+        loans_by_increment = defaultdict(list)
+        for loan_id, count in on_time_counts.items():
+            loans_by_increment[count].append(loan_id)
+        
+        now = timezone.now()
+        for increment, ids in loans_by_increment.items():
+            for chunk in _chunked(ids):
+                Loan.objects.using(alias).filter(loan_id__in=chunk).update(
+                    emis_paid_on_time=Least(F('emis_paid_on_time') + increment, F('tenure')),
+                    updated_at=now
+                )
+    
+    return len(inserted), len(on_time_counts), unknown_loans
+
+@shared_task
+def post_repayments(payments):
+    """
+    Append a batch of EMI payments to the repayment ledger and roll the
+    on-time payments into Loan.emis_paid_on_time, in one transaction per
+    shard
+    """
+    # Payments are keyed by their servicing reference so re-posting a file is a no-op
+    by_reference = {}
+    for payment in payments:
+        by_reference.setdefault(str(payment['reference']), payment)
+    
+    # Ingested loans keep their source ids, so look every loan up rather
+    # than trusting the id -> shard mapping. An id stored on two shards
+    # raises ShardConflict before anything is posted. Unsharded, every id
+    # maps to 'default' and missing loans are found while posting.
+    loan_shards = find_loan_shards({int(payment['loan_id']) for payment in by_reference.values()})
+    
+    unknown_loans = []
+    by_shard = defaultdict(dict)
+    for reference, payment in by_reference.items():
+        shard = loan_shards.get(int(payment['loan_id']))
+        if shard is None:
+            unknown_loans.append(reference)
+        else:
+            by_shard[shard][reference] = payment
+    
+    results = run_on_shards(_post_shard_repayments, by_shard).values()
+    posted = sum(shard_posted for shard_posted, _, _ in results)
+    for _, _, shard_unknown_loans in results:
+        unknown_loans.extend(shard_unknown_loans)
+    
+    return {
+        'received': len(payments),
+        'posted': posted,
+        'duplicates': len(payments) - posted - len(unknown_loans),
+        'unknown_loans': unknown_loans,
+        'loans_updated': sum(loans_updated for _, loans_updated, _ in results),
+    }
+
+def _sweep_shard(alias):
+    now = timezone.now()
+    today = now.date()
+    loans = Loan.objects.using(alias)
+    
+    with transaction.atomic(using=alias):
+        end_dates_filled = loans.filter(
+            end_date__isnull=True, start_date__isnull=False
+        ).update(end_date=AddMonths('start_date', 'tenure'), updated_at=now)
+        
+        matured = loans.filter(status='APPROVED', end_date__lte=today)
+        customer_ids = list(matured.values_list('customer_id', flat=True).distinct())
+        loans_paid = matured.update(status='PAID', updated_at=now)
+        
+        # current_debt is the sum of the customer's open (APPROVED) loans
+        open_debt = loans.filter(
+            customer=OuterRef('pk'), status='APPROVED'
+        ).values('customer').annotate(total=Sum('loan_amount')).values('total')
+        
+        customers_updated = 0
+        for chunk in _chunked(customer_ids):
+            customers_updated += Customer.objects.using(alias).filter(customer_id__in=chunk).update(
+                current_debt=Coalesce(Subquery(open_debt), Value(0.0)),
+                updated_at=now
+            )
+    
+    return Counter(
+        end_dates_filled=end_dates_filled,
+        loans_paid=loans_paid,
+        customers_updated=customers_updated
+    )
+
+@shared_task
+def sweep_loan_lifecycle():
+    """
+    Backfill missing loan end dates, move matured loans to PAID and
+    recompute current_debt for the affected customers, on every shard
+    """
+    started = time.monotonic()
+    totals = sum(run_on_all_shards(_sweep_shard).values(), Counter())
+    
+    if totals['loans_paid']:
+        invalidate_portfolio_exposure()
+    
+    return {
+        'end_dates_filled': totals['end_dates_filled'],
+        'loans_paid': totals['loans_paid'],
+        'customers_updated': totals['customers_updated'],
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    }
+
+@shared_task
+def write_portfolio_snapshot():
+    """
+    Write a memory-mappable columnar snapshot of customers and loans
+    """
+    started = time.monotonic()
+    manifest = write_snapshot()
+    return {
+        'snapshot': manifest['name'],
+        'customers': manifest['tables']['customers']['rows'],
+        'loans': manifest['tables']['loans']['rows'],
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    }
@@ -1,3 +1,660 @@
-from django.test import TestCase
-
-# Create your tests here.
+import cProfile
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+from unittest import mock, skipUnless
+
+import pandas as pd
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import DatabaseError, DataError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import snapshot as snapshot_module
+from .admission import READ, WRITE, AdmissionController, Rejected, cluster_stats
+from .analytics import BREAKDOWNS, compute_portfolio_exposure
+from .audit import AuditBuffer
+from .models import Customer, DecisionAuditLog, Loan, Repayment
+from .profiling import ProfileStore, ProfilingMiddleware
+from .scoring import MAX_EMI_TO_SALARY, calculate_history_score, credit_profile
+from .sharding import (
+    ShardConflict, allocate_ids, find_loan_shard, is_sharded, shard_aliases, shard_for_customer,
+    shard_for_new_customer
+)
+from .snapshot import PortfolioSnapshot, write_snapshot
+from .tasks import (
+    _post_shard_repayments, ingest_customer_data, ingest_loan_data, post_repayments, sweep_loan_lifecycle
+)
+
+@override_settings(CREDIT_PARALLEL_SHARDS=False)
+class ShardedTestCase(TestCase):
+    """
+    Uses every shard's test database; per-shard work runs inline so it
+    stays inside the test transactions
+    """
+    databases = '__all__'
+
+def make_customer(**fields):
+    if 'customer_id' in fields:
+        using = shard_for_customer(fields['customer_id'])
+    else:
+        # As registration does: a random shard and an id that maps back to it
+        using = shard_for_new_customer()
+        customer_ids = allocate_ids(Customer, using)
+        fields['customer_id'] = customer_ids[0] if customer_ids else None
+    defaults = {
+        'first_name': 'Test', 'last_name': 'Customer', 'age': 30, 'phone_number': '9000000000',
+        'monthly_salary': 50000, 'approved_limit': 1800000,
+    }
+    return Customer.objects.using(using).create(**{**defaults, **fields})
+
+def make_loan(customer, **fields):
+    if 'loan_id' not in fields:
+        loan_ids = allocate_ids(Loan, customer._state.db)
+        fields['loan_id'] = loan_ids[0] if loan_ids else None
+    defaults = {
+        'loan_amount': 100000, 'tenure': 12, 'interest_rate': 10.0, 'monthly_repayment': 8791.59,
+        'status': 'APPROVED', 'start_date': date(2026, 1, 1),
+    }
+    # The related manager writes to the customer's shard
+    return customer.loans.create(**{**defaults, **fields})
+
+def stored_ids(model):
+    """
+    Primary keys of `model` on every shard
+    """
+    pk = model._meta.pk.name
+    return {key for alias in shard_aliases() for key in model.objects.using(alias).values_list(pk, flat=True)}
+
+def payment(reference, loan, paid_on_time=True):
+    return {
+        'reference': reference, 'loan_id': loan.loan_id, 'amount': loan.monthly_repayment,
+        'paid_on': '2026-02-01', 'paid_on_time': paid_on_time,
+    }
+
+class RepaymentPostingTests(ShardedTestCase):
+    def setUp(self):
+        self.loan = make_loan(make_customer(), tenure=3)
+
+    def test_reposting_a_file_is_a_no_op(self):
+        payments = [payment('PAY-1', self.loan), payment('PAY-2', self.loan, paid_on_time=False)]
+
+        first = post_repayments(payments)
+        second = post_repayments(payments)
+
+        self.assertEqual((first['posted'], first['duplicates']), (2, 0))
+        self.assertEqual((second['posted'], second['duplicates']), (0, 2))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.emis_paid_on_time, 1)
+        self.assertEqual(Repayment.objects.using(self.loan._state.db).count(), 2)
+
+    def test_concurrently_posted_reference_is_skipped(self):
+        other_loan = make_loan(self.loan.customer)
+        other_loan.repayments.create(reference='PAY-1', amount=1, paid_on=date(2026, 2, 1))
+
+        # Another request posted PAY-1 after this one checked the ledger
+        with mock.patch('credit_app.tasks._existing_ids', return_value=set()):
+            posted, loans_updated, _ = _post_shard_repayments(
+                self.loan._state.db, {'PAY-1': payment('PAY-1', self.loan)}
+            )
+
+        self.assertEqual((posted, loans_updated), (0, 0))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.emis_paid_on_time, 0)
+
+    def test_payments_for_unknown_loans_are_reported(self):
+        unknown = {**payment('PAY-2', self.loan), 'loan_id': max(stored_ids(Loan)) + 1}
+
+        result = post_repayments([payment('PAY-1', self.loan), unknown])
+
+        self.assertEqual((result['posted'], result['unknown_loans']), (1, ['PAY-2']))
+        self.assertEqual(len(stored_ids(Repayment)), 1)
+
+    def test_on_time_count_is_capped_at_tenure(self):
+        post_repayments([payment(f'PAY-{n}', self.loan) for n in range(5)])
+
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.emis_paid_on_time, self.loan.tenure)
+
+    def test_endpoint_reports_duplicates(self):
+        client = APIClient()
+        body = [payment('PAY-1', self.loan)]
+
+        client.post('/post-repayments/', body, format='json')
+        response = client.post('/post-repayments/', body, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['duplicates'], 1)
+
+class BulkRegistrationTests(ShardedTestCase):
+    def test_valid_items_are_created_in_input_order_and_invalid_ones_reported(self):
+        items = [
+            {'first_name': f'Item{index}', 'last_name': 'Lee', 'age': 30, 'phone_number': '9000000000',
+             'monthly_income': monthly_income}
+            for index, monthly_income in enumerate([50000, -1, 10 ** 19, 3000000, 3_000_000_000, 1234567])
+        ]
+
+        response = APIClient().post('/register-bulk/', items, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual([error['index'] for error in body['errors']], [1, 2, 4])
+        self.assertEqual(
+            [(created['index'], created['approved_limit']) for created in body['created']],
+            [(0, 1800000), (3, 108000000), (5, 44400000)]
+        )
+        for created in body['created']:
+            customer_id = created['customer_id']
+            customer = Customer.objects.using(shard_for_customer(customer_id)).get(customer_id=customer_id)
+            self.assertEqual(customer.first_name, f"Item{created['index']}")
+            self.assertEqual(customer.approved_limit, created['approved_limit'])
+
+class CreditScoreTests(ShardedTestCase):
+    def test_on_time_payments_above_tenure_do_not_raise_score_above_100(self):
+        customer = make_customer()
+        make_loan(customer, tenure=12, emis_paid_on_time=20)
+
+        self.assertEqual(calculate_history_score(customer, credit_profile(customer)), 100)
+
+class LoanQuoteTests(ShardedTestCase):
+    def setUp(self):
+        self.customer = make_customer(monthly_salary=40000, approved_limit=10000000)
+        make_loan(self.customer, monthly_repayment=5000)
+        self.client = APIClient()
+
+    def quote(self, tenures, interest_rates):
+        return self.client.post('/quote-offers/', {
+            'customer_id': self.customer.customer_id, 'tenures': tenures, 'interest_rates': interest_rates,
+        }, format='json')
+
+    def test_quoted_amount_is_the_largest_within_the_emi_limit(self):
+        response = self.quote([12, 60, 600], [0, 10.5])
+
+        self.assertEqual(response.status_code, 200)
+        emi_headroom = MAX_EMI_TO_SALARY * self.customer.monthly_salary - 5000
+        for offer in response.json()['offers']:
+            amount, rate, tenure = offer['max_loan_amount'], offer['corrected_interest_rate'], offer['tenure']
+            self.assertLessEqual(Loan.calculate_monthly_installment(amount, rate, tenure), emi_headroom)
+            self.assertGreater(Loan.calculate_monthly_installment(amount + 1, rate, tenure), emi_headroom)
+
+    def test_out_of_range_tenures_and_rates_are_rejected(self):
+        self.assertEqual(self.quote([100000], [12]).status_code, 400)
+        self.assertEqual(self.quote([12], [1000]).status_code, 400)
+
+class LoanLifecycleSweepTests(ShardedTestCase):
+    def test_matured_loans_are_paid_and_debt_recomputed(self):
+        customer = make_customer(current_debt=300000)
+        matured = make_loan(customer, loan_amount=100000, start_date=date(2020, 1, 31), tenure=13)
+        running = make_loan(customer, loan_amount=200000, start_date=date(2026, 1, 1), tenure=60)
+
+        first = sweep_loan_lifecycle()
+        second = sweep_loan_lifecycle()
+
+        self.assertEqual(
+            (first['end_dates_filled'], first['loans_paid'], first['customers_updated']), (2, 1, 1)
+        )
+        self.assertEqual(
+            (second['end_dates_filled'], second['loans_paid'], second['customers_updated']), (0, 0, 0)
+        )
+        matured.refresh_from_db()
+        running.refresh_from_db()
+        customer.refresh_from_db()
+        self.assertEqual((matured.status, matured.end_date), ('PAID', date(2021, 2, 28)))
+        self.assertEqual((running.status, running.end_date), ('APPROVED', date(2031, 1, 1)))
+        self.assertEqual(customer.current_debt, 200000)
+
+class PortfolioSnapshotTests(ShardedTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_loans_are_joined_to_their_customers(self):
+        customers = [make_customer(monthly_salary=salary) for salary in (30000, 60000)]
+        for customer in reversed(customers):
+            make_loan(customer)
+
+        write_snapshot(self.directory)
+        snapshot = PortfolioSnapshot.open(self.directory)
+
+        self.assertEqual(
+            list(snapshot.loan_customer_column('customer_id')),
+            list(snapshot.loans['customer_id'])
+        )
+        self.assertEqual(sorted(snapshot.loan_customer_column('monthly_salary')), [30000, 60000])
+
+    def test_loan_without_customer_in_snapshot_is_dropped(self):
+        customer = make_customer()
+        make_loan(customer)
+        orphan = make_loan(make_customer())
+        real_read_shard = snapshot_module._read_shard
+
+        # A customer created between the reads: its loan is seen, it is not
+        def read_shard(alias):
+            rows = real_read_shard(alias)
+            rows[Customer] = [row for row in rows[Customer] if row[0] != orphan.customer_id]
+            return rows
+
+        with mock.patch('credit_app.snapshot._read_shard', side_effect=read_shard):
+            manifest = write_snapshot(self.directory)
+
+        snapshot = PortfolioSnapshot.open(self.directory)
+        self.assertEqual(manifest['loans_without_customer'], 1)
+        self.assertEqual(list(snapshot.loans['customer_id']), [customer.customer_id])
+        self.assertEqual(list(snapshot.loan_customer_column('customer_id')), [customer.customer_id])
+
+    def test_failed_snapshot_leaves_no_staging_directory(self):
+        make_loan(make_customer())
+
+        with mock.patch('credit_app.snapshot._read_shard', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                write_snapshot(self.directory)
+        with mock.patch('credit_app.snapshot.np.save', side_effect=OSError):
+            with self.assertRaises(OSError):
+                write_snapshot(self.directory)
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+class PortfolioExposureTests(ShardedTestCase):
+    def test_emi_burden_is_per_borrower(self):
+        heavy = make_customer(monthly_salary=10000)
+        light = make_customer(monthly_salary=10000)
+        for _ in range(3):
+            make_loan(heavy, monthly_repayment=1000, tenure=12)
+        make_loan(light, monthly_repayment=1000, tenure=36)
+
+        # One grouped query per breakdown plus the totals, on each shard
+        with self.assertNumQueries(1 + len(BREAKDOWNS), using=heavy._state.db):
+            exposure = compute_portfolio_exposure()
+
+        # Borrower burdens 0.3 and 0.1, not four loans at 0.1 each
+        self.assertEqual(exposure['totals']['borrowers'], 2)
+        self.assertEqual(exposure['totals']['average_emi_to_salary_ratio'], 0.2)
+        by_tenure = {row['bucket']: row for row in exposure['by_tenure_band']}
+        self.assertEqual(by_tenure['0-12']['average_emi_to_salary_ratio'], 0.3)
+        self.assertEqual(by_tenure['25-60']['average_emi_to_salary_ratio'], 0.1)
+
+CUSTOMER_COLUMNS = [
+    'Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number', 'Monthly Salary', 'Approved Limit',
+]
+
+def customer_row(customer_id, **fields):
+    row = {
+        'Customer ID': customer_id, 'First Name': 'Ann', 'Last Name': 'Lee', 'Age': 40,
+        'Phone Number': 9000000000 + customer_id, 'Monthly Salary': 50000, 'Approved Limit': 1800000,
+    }
+    row.update(fields)
+    return row
+
+LOAN_COLUMNS = [
+    'Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate', 'Monthly payment',
+    'EMIs paid on Time', 'Date of Approval', 'End Date',
+]
+
+def loan_row(customer_id, loan_id, **fields):
+    row = {
+        'Customer ID': customer_id, 'Loan ID': loan_id, 'Loan Amount': 100000, 'Tenure': 12,
+        'Interest Rate': 10.0, 'Monthly payment': 8791.59, 'EMIs paid on Time': 2,
+        'Date of Approval': '2026-01-01', 'End Date': '2027-01-01',
+    }
+    row.update(fields)
+    return row
+
+class IngestionTests(ShardedTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(INGESTION_REPORT_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write_file(self, name, rows, columns):
+        path = os.path.join(self.directory, name)
+        pd.DataFrame(rows, columns=columns).to_excel(path, index=False)
+        return path
+
+    def test_rows_violating_field_constraints_are_rejected_individually(self):
+        path = self.write_file('customers.xlsx', [
+            customer_row(1),
+            customer_row(2, **{'Phone Number': '1' * 20}),
+            customer_row(3, **{'First Name': 'x' * 101}),
+            customer_row(4),
+        ], CUSTOMER_COLUMNS)
+
+        report = ingest_customer_data(path)
+
+        self.assertEqual(report['status'], 'ok')
+        self.assertEqual((report['rows_inserted'], report['rows_rejected']), (2, 2))
+        self.assertEqual(stored_ids(Customer), {1, 4})
+        with open(report['rejected_rows_file']) as f:
+            rejected = list(csv.DictReader(f))
+        self.assertEqual([row['row_number'] for row in rejected], ['3', '4'])
+        self.assertIn('phone_number', rejected[0]['reason'])
+        self.assertIn('first_name', rejected[1]['reason'])
+
+    def test_unchanged_files_and_rows_are_skipped(self):
+        path = self.write_file('customers.xlsx', [customer_row(1), customer_row(2)], CUSTOMER_COLUMNS)
+
+        first = ingest_customer_data(path)
+        second = ingest_customer_data(path)
+        self.write_file('customers.xlsx', [customer_row(1), customer_row(2, Age=41)], CUSTOMER_COLUMNS)
+        third = ingest_customer_data(path)
+
+        self.assertEqual(first['rows_inserted'], 2)
+        self.assertEqual(second['status'], 'unchanged')
+        self.assertEqual((third['rows_unchanged'], third['rows_updated']), (1, 1))
+        self.assertEqual(Customer.objects.using(shard_for_customer(2)).get(customer_id=2).age, 41)
+
+    def test_rejected_rows_are_retried_once_their_customer_is_fixed(self):
+        customers_path = self.write_file(
+            'customers.xlsx', [customer_row(1, **{'Phone Number': '1' * 20})], CUSTOMER_COLUMNS
+        )
+        loans_path = self.write_file('loans.xlsx', [loan_row(1, 100)], LOAN_COLUMNS)
+        ingest_customer_data(customers_path)
+        first = ingest_loan_data(loans_path)
+
+        self.write_file('customers.xlsx', [customer_row(1)], CUSTOMER_COLUMNS)
+        ingest_customer_data(customers_path)
+        second = ingest_loan_data(loans_path)
+
+        self.assertEqual((first['rows_inserted'], first['rows_rejected']), (0, 1))
+        self.assertEqual((second['status'], second['rows_inserted']), ('ok', 1))
+        self.assertEqual(stored_ids(Loan), {100})
+
+    def test_reingesting_a_loan_keeps_the_ledger_on_time_count(self):
+        ingest_customer_data(self.write_file('customers.xlsx', [customer_row(1)], CUSTOMER_COLUMNS))
+        loans_path = self.write_file('loans.xlsx', [loan_row(1, 100)], LOAN_COLUMNS)
+        ingest_loan_data(loans_path)
+        loan = Loan.objects.using(find_loan_shard(100)).get(loan_id=100)
+        self.assertEqual(loan.emis_paid_on_time, 2)
+        post_repayments([payment('PAY-1', loan)])
+
+        self.write_file('loans.xlsx', [loan_row(1, 100, **{'Loan Amount': 120000})], LOAN_COLUMNS)
+        report = ingest_loan_data(loans_path)
+
+        loan.refresh_from_db()
+        self.assertEqual(report['rows_updated'], 1)
+        self.assertEqual(loan.loan_amount, 120000)
+        self.assertEqual(loan.emis_paid_on_time, 3)
+
+@skipUnless(is_sharded(), "needs CREDIT_SQLITE_SHARDS > 1")
+class ShardingTests(ShardedTestCase):
+    def setUp(self):
+        self.default, self.other = shard_aliases()[:2]
+        self.customers = {
+            alias: make_customer(customer_id=shard_aliases().index(alias) + len(shard_aliases()))
+            for alias in (self.default, self.other)
+        }
+
+    def loan_on(self, alias, loan_id):
+        return make_loan(self.customers[alias], loan_id=loan_id)
+
+    def test_allocated_loan_ids_are_above_ids_on_every_shard(self):
+        self.loan_on(self.other, 1000)
+
+        ids = allocate_ids(Loan, self.default, count=2)
+
+        self.assertTrue(all(loan_id > 1000 for loan_id in ids))
+        self.assertTrue(all(shard_aliases()[loan_id % len(shard_aliases())] == self.default for loan_id in ids))
+
+    def test_loan_id_on_two_shards_fails_loudly(self):
+        loans = [self.loan_on(alias, 500) for alias in (self.default, self.other)]
+
+        with self.assertRaises(ShardConflict):
+            find_loan_shard(500)
+        with self.assertRaises(ShardConflict):
+            post_repayments([payment('PAY-1', loans[0])])
+        self.assertFalse(any(Repayment.objects.using(alias).exists() for alias in shard_aliases()))
+
+    def test_ingesting_a_loan_id_stored_on_another_shard_is_rejected(self):
+        self.loan_on(self.other, 500)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'loans.xlsx')
+        customer_id = self.customers[self.default].customer_id
+        pd.DataFrame([loan_row(customer_id, 500), loan_row(customer_id, 501)], columns=LOAN_COLUMNS).to_excel(
+            path, index=False
+        )
+
+        with override_settings(INGESTION_REPORT_DIR=directory):
+            report = ingest_loan_data(path)
+
+        self.assertEqual((report['rows_inserted'], report['rows_rejected']), (1, 1))
+        self.assertFalse(Loan.objects.using(self.default).filter(loan_id=500).exists())
+
+def decision(customer_id):
+    return {
+        'decision': 'ELIGIBILITY', 'decided_at': timezone.now(), 'customer_id': customer_id,
+        'loan_amount': 100000, 'interest_rate': 10.0, 'tenure': 12, 'credit_score': 80, 'approval': True,
+        'corrected_interest_rate': 10.0, 'monthly_installment': 8791.59,
+    }
+
+# No background flusher: the tests drive every write
+@override_settings(CREDIT_SHARDS=['default'])
+class UnshardedTests(ShardedTestCase):
+    def test_loan_lookup_runs_no_extra_query(self):
+        loan = make_loan(make_customer())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(find_loan_shard(loan.loan_id), 'default')
+        with self.assertNumQueries(1), override_settings(FAST_READ_SERIALIZATION=True):
+            self.assertEqual(APIClient().get(f'/view-loan/{loan.loan_id}/').status_code, 200)
+        with override_settings(FAST_READ_SERIALIZATION=True):
+            self.assertEqual(APIClient().get(f'/view-loan/{loan.loan_id + 1}/').status_code, 404)
+
+@mock.patch.object(AuditBuffer, '_ensure_thread')
+class AuditBufferTests(ShardedTestCase):
+    def test_flush_writes_every_buffered_record(self, _):
+        buffer = AuditBuffer(max_size=10, batch_size=2)
+        for customer_id in range(3):
+            buffer.record(decision(customer_id))
+
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(DecisionAuditLog.objects.count(), 3)
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_full_buffer_writes_a_batch_before_accepting_more(self, _):
+        buffer = AuditBuffer(max_size=2, batch_size=2)
+        for customer_id in range(3):
+            buffer.record(decision(customer_id))
+
+        self.assertEqual(buffer.backpressure_flushes, 1)
+        self.assertEqual(DecisionAuditLog.objects.count(), 2)
+        self.assertEqual(buffer.pending(), 1)
+
+    def test_failing_batch_is_dead_lettered_without_failing_the_request(self, _):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        buffer = AuditBuffer(max_size=1, batch_size=1, max_attempts=2)
+
+        with override_settings(AUDIT_DEAD_LETTER_DIR=directory), \
+                mock.patch.object(DecisionAuditLog.objects, 'bulk_create', side_effect=DataError), \
+                self.assertLogs('credit_app.audit', 'ERROR'):
+            buffer.record(decision(1))
+            buffer.record(decision(2))
+
+        self.assertEqual((buffer.failed_flushes, buffer.dead_lettered, buffer.pending()), (2, 1, 1))
+        with open(os.path.join(directory, f'audit-{os.getpid()}.jsonl')) as f:
+            self.assertEqual([json.loads(line)['customer_id'] for line in f], [1])
+
+        # The next batch is written normally
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(DecisionAuditLog.objects.values_list('customer_id', flat=True)), [2])
+
+# No background publisher: the tests publish explicitly
+@mock.patch.object(AdmissionController, '_ensure_publisher')
+class AdmissionControllerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def controller(self, **limits):
+        defaults = {
+            'max_in_flight': 2, 'reserved_for_writes': 0, 'max_queue': 8, 'max_per_customer': 1,
+            'queue_timeouts': {READ: 1.0, WRITE: 1.0},
+        }
+        return AdmissionController(**{**defaults, **limits})
+
+    def start(self, controller, priority):
+        outcome = []
+
+        def run():
+            try:
+                controller.acquire(priority)
+                outcome.append('admitted')
+            except Rejected as exc:
+                outcome.append(exc.reason)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread, outcome
+
+    def wait_until_queued(self, controller, priority):
+        deadline = time.monotonic() + 1
+        while not controller.stats()['queued'][priority]:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_queued_read_starts_once_queued_write_is_admitted(self, _):
+        controller = self.controller(queue_timeouts={READ: 5.0, WRITE: 5.0})
+        controller.acquire(READ)
+        controller.acquire(READ)
+        read, read_outcome = self.start(controller, READ)
+        self.wait_until_queued(controller, READ)
+        write, write_outcome = self.start(controller, WRITE)
+        self.wait_until_queued(controller, WRITE)
+
+        # Both slots free up at once; the read wakes first and yields to the write
+        with controller._condition:
+            controller.release(READ)
+            controller.release(READ)
+        write.join()
+        # Well before the read's queue timeout: it must be woken, not time out
+        read.join(timeout=1)
+
+        self.assertEqual((write_outcome, read_outcome), (['admitted'], ['admitted']))
+
+    def test_origination_is_not_limited_per_customer(self, _):
+        controller = self.controller(max_in_flight=4)
+        controller.acquire(READ, '7')
+
+        with self.assertRaises(Rejected) as raised:
+            controller.acquire(READ, '7')
+        controller.acquire(WRITE, '7')
+        controller.release(WRITE, '7')
+
+        self.assertEqual(raised.exception.reason, 'customer_limit')
+        self.assertEqual(controller.stats()['in_flight'], {READ: 1, WRITE: 0})
+
+    def test_cluster_stats_add_up_every_worker(self, _):
+        workers = [self.controller(), self.controller()]
+        for worker in workers:
+            worker.acquire(READ, '7')
+            with self.assertRaises(Rejected):
+                worker.acquire(READ, '7')
+        workers[0].acquire(WRITE)
+
+        for worker in workers:
+            worker.publish()
+
+        stats = cluster_stats()
+        self.assertEqual(
+            {key: stats[key] for key in ('admitted', 'shed', 'in_flight', 'queued')},
+            {
+                'admitted': {READ: 2, WRITE: 1},
+                'shed': {'read:customer_limit': 2},
+                'in_flight': {READ: 2, WRITE: 1},
+                'queued': {READ: 0, WRITE: 0},
+            }
+        )
+        self.assertEqual({worker['worker'] for worker in stats['workers']}, {worker.worker_id for worker in workers})
+
+    def test_requests_do_not_touch_the_cache(self, _):
+        controller = self.controller()
+
+        with mock.patch('credit_app.admission.cache') as shared_cache:
+            controller.acquire(READ, '7')
+            controller.release(READ, '7')
+
+        self.assertEqual(shared_cache.mock_calls, [])
+
+    def test_counts_survive_a_cache_outage_and_warn_once(self, _):
+        controller = self.controller()
+        controller.acquire(READ)
+
+        with mock.patch.object(cache, 'incr', side_effect=ConnectionError), \
+                self.assertLogs('credit_app.admission', 'WARNING') as logs:
+            controller.publish()
+            controller.publish()
+        controller.publish()
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(cluster_stats()['admitted'], {READ: 1, WRITE: 0})
+
+class ProfilingTests(ShardedTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(PROFILING_DIR=self.directory, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.loan = make_loan(make_customer())
+
+    def test_middleware_is_removed_when_profiling_is_off(self):
+        with override_settings(PROFILING_TOKEN=None, PROFILING_SAMPLE_RATE=0), self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+    def test_request_with_the_token_is_profiled(self):
+        response = APIClient().get(f'/view-loan/{self.loan.loan_id}/', HTTP_X_PROFILE='secret')
+
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(sorted(os.listdir(self.directory)), [f'{profile_id}.json', f'{profile_id}.prof'])
+        summary = ProfileStore().load(profile_id)
+        self.assertEqual((summary['trigger'], summary['path']), ('header', f'/view-loan/{self.loan.loan_id}/'))
+        self.assertEqual(summary['sql_count'], len(summary['sql']))
+        self.assertTrue(any('credit_app_loan' in statement['sql'] for statement in summary['sql']))
+
+        listing, details = io.StringIO(), io.StringIO()
+        call_command('profiles', 'list', stdout=listing)
+        call_command('profiles', 'show', profile_id, stdout=details)
+        self.assertIn(profile_id, listing.getvalue())
+        self.assertIn(f"SQL: {summary['sql_count']} statements", details.getvalue())
+
+    def test_wrong_token_is_not_profiled(self):
+        response = APIClient().get(f'/view-loan/{self.loan.loan_id}/', HTTP_X_PROFILE='guess')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(ProfileStore().ids(), [])
+
+    def test_store_keeps_the_newest_entries(self):
+        store = ProfileStore(max_entries=2)
+        for profile_id in ('20260101T000000000000-a', '20260101T000001000000-b', '20260101T000002000000-c'):
+            store.save(profile_id, cProfile.Profile(), {'id': profile_id})
+
+        self.assertEqual(store.ids(), ['20260101T000001000000-b', '20260101T000002000000-c'])
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+class FastReadSerializationTests(ShardedTestCase):
+    def test_fast_path_responses_are_byte_identical(self):
+        customer = make_customer()
+        loans = [
+            make_loan(customer, loan_amount=123456.789, interest_rate=10.25, monthly_repayment=1e16),
+            make_loan(customer, status='PAID', start_date=date(2020, 5, 31)),
+        ]
+        client = APIClient()
+        for path in [f'/view-loans/{customer.customer_id}/'] + [f'/view-loan/{loan.loan_id}/' for loan in loans]:
+            with override_settings(FAST_READ_SERIALIZATION=False):
+                expected = client.get(path).content
+            with override_settings(FAST_READ_SERIALIZATION=True):
+                actual = client.get(path).content
+            self.assertEqual(actual, expected, path)
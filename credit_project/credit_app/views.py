@@ -1,231 +1,292 @@
-from django.shortcuts import render, get_object_or_404
-from rest_framework import status, generics
-from rest_framework.response import Response
-from rest_framework.views import APIView
-from django.db.models import Sum
-
-from .models import Customer, Loan
-from .serializers import (
-    CustomerSerializer, CustomerRegistrationSerializer,
-    LoanEligibilitySerializer, LoanEligibilityResponseSerializer,
-    LoanCreateSerializer, LoanResponseSerializer,
-    LoanDetailSerializer, CustomerLoanSerializer
-)
-
-class CustomerRegistrationView(APIView):
-    def post(self, request):
-        serializer = CustomerRegistrationSerializer(data=request.data)
-        if serializer.is_valid():
-            customer = serializer.save()
-            response_serializer = CustomerSerializer(customer)
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-class LoanEligibilityView(APIView):
-    def post(self, request):
-        serializer = LoanEligibilitySerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        data = serializer.validated_data
-        customer_id = data['customer_id']
-        loan_amount = data['loan_amount']
-        interest_rate = data['interest_rate']
-        tenure = data['tenure']
-        
-        try:
-            customer = Customer.objects.get(customer_id=customer_id)
-        except Customer.DoesNotExist:
-            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Calculate credit score
-        credit_score = self._calculate_credit_score(customer, loan_amount)
-        
-        # Check if sum of current EMIs > 50% of monthly salary
-        current_loans = Loan.objects.filter(customer=customer, status='APPROVED')
-        total_monthly_emi = current_loans.aggregate(Sum('monthly_repayment'))['monthly_repayment__sum'] or 0
-        
-        # Calculate monthly installment for the new loan
-        monthly_installment = Loan.calculate_monthly_installment(loan_amount, interest_rate, tenure)
-        
-        # Check if total EMIs (including new loan) would exceed 50% of salary
-        if (total_monthly_emi + monthly_installment) > (0.5 * customer.monthly_salary):
-            approval = False
-            corrected_interest_rate = interest_rate
-        else:
-            # Determine approval and corrected interest rate based on credit score
-            approval, corrected_interest_rate = self._determine_approval_and_rate(credit_score, interest_rate)
-        
-        response_data = {
-            'customer_id': customer_id,
-            'approval': approval,
-            'interest_rate': interest_rate,
-            'corrected_interest_rate': corrected_interest_rate,
-            'tenure': tenure,
-            'monthly_installment': monthly_installment
-        }
-        
-        return Response(response_data, status=status.HTTP_200_OK)
-    
-    def _calculate_credit_score(self, customer, loan_amount):
-        # Initialize credit score
-        credit_score = 100
-        
-        # Get all loans for this customer
-        loans = Loan.objects.filter(customer=customer)
-        
-        # If sum of current loans > approved limit, credit score = 0
-        current_debt = loans.filter(status='APPROVED').aggregate(Sum('loan_amount'))['loan_amount__sum'] or 0
-        if current_debt + loan_amount > customer.approved_limit:
-            return 0
-        
-        # Calculate components for credit score
-        if loans.exists():
-            # Past loans paid on time
-            total_emis = loans.aggregate(Sum('tenure'))['tenure__sum'] or 0
-            on_time_emis = loans.aggregate(Sum('emis_paid_on_time'))['emis_paid_on_time__sum'] or 0
-            if total_emis > 0:
-                on_time_ratio = on_time_emis / total_emis
-                # Adjust score based on payment history (max impact: 40 points)
-                credit_score -= 40 * (1 - on_time_ratio)
-            
-            # Number of loans taken in past (max impact: 20 points)
-            num_loans = loans.count()
-            if num_loans > 5:
-                credit_score -= 20
-            elif num_loans > 3:
-                credit_score -= 10
-            
-            # Loan activity in current year (max impact: 20 points)
-            from django.utils import timezone
-            current_year = timezone.now().year
-            loans_this_year = loans.filter(start_date__year=current_year).count()
-            if loans_this_year > 3:
-                credit_score -= 20
-            elif loans_this_year > 1:
-                credit_score -= 10
-            
-            # Loan approved volume relative to salary (max impact: 20 points)
-            loan_volume_ratio = current_debt / customer.monthly_salary
-            if loan_volume_ratio > 24:  # More than 2 years of salary
-                credit_score -= 20
-            elif loan_volume_ratio > 12:  # More than 1 year of salary
-                credit_score -= 10
-        
-        return max(0, credit_score)  # Ensure score is not negative
-    
-    def _determine_approval_and_rate(self, credit_score, interest_rate):
-        if credit_score > 50:
-            # Approve loan with given interest rate
-            return True, interest_rate
-        elif credit_score > 30:
-            # Approve loans with interest rate > 12%
-            if interest_rate > 12:
-                return True, interest_rate
-            else:
-                return True, 12.0
-        elif credit_score > 10:
-            # Approve loans with interest rate > 16%
-            if interest_rate > 16:
-                return True, interest_rate
-            else:
-                return True, 16.0
-        else:
-            # Don't approve any loans
-            return False, interest_rate
-
-class LoanCreateView(APIView):
-    def post(self, request):
-        serializer = LoanCreateSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        data = serializer.validated_data
-        customer_id = data['customer_id']
-        loan_amount = data['loan_amount']
-        interest_rate = data['interest_rate']
-        tenure = data['tenure']
-        
-        try:
-            customer = Customer.objects.get(customer_id=customer_id)
-        except Customer.DoesNotExist:
-            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Check eligibility
-        eligibility_view = LoanEligibilityView()
-        credit_score = eligibility_view._calculate_credit_score(customer, loan_amount)
-        
-        # Calculate monthly installment
-        monthly_installment = Loan.calculate_monthly_installment(loan_amount, interest_rate, tenure)
-        
-        # Check if total EMIs would exceed 50% of salary
-        current_loans = Loan.objects.filter(customer=customer, status='APPROVED')
-        total_monthly_emi = current_loans.aggregate(Sum('monthly_repayment'))['monthly_repayment__sum'] or 0
-        
-        if (total_monthly_emi + monthly_installment) > (0.5 * customer.monthly_salary):
-            return Response({
-                "loan_id": None,
-                "customer_id": customer_id,
-                "loan_approved": False,
-                "message": "EMIs would exceed 50% of monthly salary",
-                "monthly_installment": monthly_installment
-            }, status=status.HTTP_200_OK)
-        
-        # Determine approval based on credit score
-        approval, corrected_interest_rate = eligibility_view._determine_approval_and_rate(credit_score, interest_rate)
-        
-        if not approval:
-            return Response({
-                "loan_id": None,
-                "customer_id": customer_id,
-                "loan_approved": False,
-                "message": "Low credit score",
-                "monthly_installment": monthly_installment
-            }, status=status.HTTP_200_OK)
-        
-        # If interest rate needs correction and is different from requested
-        if corrected_interest_rate != interest_rate:
-            return Response({
-                "loan_id": None,
-                "customer_id": customer_id,
-                "loan_approved": False,
-                "message": f"Interest rate should be at least {corrected_interest_rate}%",
-                "monthly_installment": monthly_installment
-            }, status=status.HTTP_200_OK)
-        
-        # Create the loan
-        loan = Loan.objects.create(
-            customer=customer,
-            loan_amount=loan_amount,
-            interest_rate=interest_rate,
-            tenure=tenure,
-            monthly_repayment=monthly_installment,
-            status='APPROVED',
-            start_date=None,  # Will be set when loan is disbursed
-            end_date=None     # Will be calculated when loan is disbursed
-        )
-        
-        # Update customer's current debt
-        customer.current_debt += loan_amount
-        customer.save()
-        
-        return Response({
-            "loan_id": loan.loan_id,
-            "customer_id": customer_id,
-            "loan_approved": True,
-            "message": "Loan approved",
-            "monthly_installment": monthly_installment
-        }, status=status.HTTP_201_CREATED)
-
-class LoanDetailView(APIView):
-    def get(self, request, loan_id):
-        loan = get_object_or_404(Loan, loan_id=loan_id)
-        serializer = LoanDetailSerializer(loan)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-class CustomerLoansView(APIView):
-    def get(self, request, customer_id):
-        customer = get_object_or_404(Customer, customer_id=customer_id)
-        loans = Loan.objects.filter(customer=customer, status='APPROVED')
-        serializer = CustomerLoanSerializer(loans, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render, get_object_or_404
+from rest_framework import status, generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.utils import timezone
+
+from .admission import READ, WRITE, admission_controlled, cluster_stats, get_controller
+from .analytics import get_portfolio_exposure
+from .audit import record_decision
+from .models import Customer, Loan
+from .scoring import (
+    calculate_credit_score, calculate_history_score, credit_profile,
+    determine_approval_and_rate, exceeds_emi_limit, quote_offers
+)
+from .sharding import allocate_ids, find_loan_shard, shard_for_customer
+from .serializers import (
+    CustomerSerializer, CustomerRegistrationSerializer,
+    LoanEligibilitySerializer, LoanEligibilityResponseSerializer, LoanQuoteSerializer,
+    LoanCreateSerializer, LoanResponseSerializer,
+    LoanDetailSerializer, CustomerLoanSerializer,
+    RepaymentSerializer, LoanDetailRowSerializer, CustomerLoanRowSerializer
+)
+from .tasks import post_repayments
+
+class CustomerRegistrationView(APIView):
+    def post(self, request):
+        serializer = CustomerRegistrationSerializer(data=request.data)
+        if serializer.is_valid():
+            customer = serializer.save()
+            response_serializer = CustomerSerializer(customer)
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class BulkCustomerRegistrationView(APIView):
+    def post(self, request):
+        items = request.data.get('customers') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"error": "Expected a list of customers"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_REGISTRATION_MAX_ITEMS:
+            return Response(
+                {"error": f"At most {settings.BULK_REGISTRATION_MAX_ITEMS} customers per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Validate item by item with one child serializer so one bad record
+        # does not reject the whole batch
+        serializer = CustomerRegistrationSerializer(many=True)
+        valid_indexes = []
+        validated_data = []
+        errors = []
+        for index, item in enumerate(items):
+            try:
+                validated_data.append(serializer.child.run_validation(item))
+                valid_indexes.append(index)
+            except ValidationError as exc:
+                errors.append({"index": index, "errors": exc.detail})
+        
+        customers = serializer.create(validated_data) if validated_data else []
+        
+        return Response({
+            "created": [
+                {"index": index, "customer_id": customer.customer_id, "approved_limit": customer.approved_limit}
+                for index, customer in zip(valid_indexes, customers)
+            ],
+            "errors": errors,
+        }, status=status.HTTP_201_CREATED if customers else status.HTTP_400_BAD_REQUEST)
+
+class LoanEligibilityView(APIView):
+    @admission_controlled(READ)
+    def post(self, request):
+        serializer = LoanEligibilitySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        customer_id = data['customer_id']
+        loan_amount = data['loan_amount']
+        interest_rate = data['interest_rate']
+        tenure = data['tenure']
+        
+        try:
+            customer = Customer.objects.using(shard_for_customer(customer_id)).get(customer_id=customer_id)
+        except Customer.DoesNotExist:
+            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        profile = credit_profile(customer)
+        
+        # Calculate credit score
+        credit_score = calculate_credit_score(customer, profile, loan_amount)
+        
+        # Calculate monthly installment for the new loan
+        monthly_installment = Loan.calculate_monthly_installment(loan_amount, interest_rate, tenure)
+        
+        # Check if total EMIs (including new loan) would exceed 50% of salary
+        if exceeds_emi_limit(customer, profile, monthly_installment):
+            approval = False
+            corrected_interest_rate = interest_rate
+        else:
+            # Determine approval and corrected interest rate based on credit score
+            approval, corrected_interest_rate = determine_approval_and_rate(credit_score, interest_rate)
+        
+        response_data = {
+            'customer_id': customer_id,
+            'approval': approval,
+            'interest_rate': interest_rate,
+            'corrected_interest_rate': corrected_interest_rate,
+            'tenure': tenure,
+            'monthly_installment': monthly_installment
+        }
+        
+        record_decision(
+            'ELIGIBILITY',
+            loan_amount=loan_amount,
+            credit_score=credit_score,
+            **response_data
+        )
+        
+        return Response(response_data, status=status.HTTP_200_OK)
+
+class LoanQuoteView(APIView):
+    @admission_controlled(READ)
+    def post(self, request):
+        serializer = LoanQuoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        customer_id = data['customer_id']
+        
+        try:
+            customer = Customer.objects.using(shard_for_customer(customer_id)).get(customer_id=customer_id)
+        except Customer.DoesNotExist:
+            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        profile = credit_profile(customer)
+        
+        return Response({
+            'customer_id': customer_id,
+            'credit_score': calculate_history_score(customer, profile),
+            'offers': quote_offers(customer, profile, data['tenures'], data['interest_rates']),
+        }, status=status.HTTP_200_OK)
+
+class LoanCreateView(APIView):
+    @admission_controlled(WRITE)
+    def post(self, request):
+        serializer = LoanCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = serializer.validated_data
+        customer_id = data['customer_id']
+        loan_amount = data['loan_amount']
+        interest_rate = data['interest_rate']
+        tenure = data['tenure']
+        
+        try:
+            customer = Customer.objects.using(shard_for_customer(customer_id)).get(customer_id=customer_id)
+        except Customer.DoesNotExist:
+            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Check eligibility
+        profile = credit_profile(customer)
+        credit_score = calculate_credit_score(customer, profile, loan_amount)
+        
+        # Calculate monthly installment
+        monthly_installment = Loan.calculate_monthly_installment(loan_amount, interest_rate, tenure)
+        
+        # Check if total EMIs would exceed 50% of salary
+        if exceeds_emi_limit(customer, profile, monthly_installment):
+            return self._decide(
+                data, credit_score, interest_rate, None,
+                "EMIs would exceed 50% of monthly salary", monthly_installment
+            )
+        
+        # Determine approval based on credit score
+        approval, corrected_interest_rate = determine_approval_and_rate(credit_score, interest_rate)
+        
+        if not approval:
+            return self._decide(
+                data, credit_score, corrected_interest_rate, None,
+                "Low credit score", monthly_installment
+            )
+        
+        # If interest rate needs correction and is different from requested
+        if corrected_interest_rate != interest_rate:
+            return self._decide(
+                data, credit_score, corrected_interest_rate, None,
+                f"Interest rate should be at least {corrected_interest_rate}%", monthly_installment
+            )
+        
+        # Create the loan
+        loan_ids = allocate_ids(Loan, customer._state.db)
+        loan = Loan.objects.using(customer._state.db).create(
+            loan_id=loan_ids[0] if loan_ids else None,
+            customer=customer,
+            loan_amount=loan_amount,
+            interest_rate=interest_rate,
+            tenure=tenure,
+            monthly_repayment=monthly_installment,
+            status='APPROVED',
+            start_date=timezone.now().date(),
+            end_date=None     # Filled in by the sweep_loan_lifecycle task
+        )
+        
+        # Update customer's current debt
+        customer.current_debt += loan_amount
+        customer.save()
+        
+        return self._decide(
+            data, credit_score, corrected_interest_rate, loan,
+            "Loan approved", monthly_installment
+        )
+    
+    def _decide(self, data, credit_score, corrected_interest_rate, loan, message, monthly_installment):
+        record_decision(
+            'ORIGINATION',
+            customer_id=data['customer_id'],
+            loan_id=loan.loan_id if loan else None,
+            loan_amount=data['loan_amount'],
+            interest_rate=data['interest_rate'],
+            tenure=data['tenure'],
+            credit_score=credit_score,
+            approval=loan is not None,
+            corrected_interest_rate=corrected_interest_rate,
+            monthly_installment=monthly_installment,
+            message=message
+        )
+        return Response({
+            "loan_id": loan.loan_id if loan else None,
+            "customer_id": data['customer_id'],
+            "loan_approved": loan is not None,
+            "message": message,
+            "monthly_installment": monthly_installment
+        }, status=status.HTTP_201_CREATED if loan else status.HTTP_200_OK)
+
+class LoanDetailView(APIView):
+    def get(self, request, loan_id):
+        shard = find_loan_shard(loan_id)
+        if shard is None:
+            raise Http404('No Loan matches the given query.')
+        loans = Loan.objects.using(shard)
+        
+        if settings.FAST_READ_SERIALIZATION:
+            serializer = LoanDetailRowSerializer()
+            row = loans.filter(loan_id=loan_id).values(*serializer.sources).first()
+            if row is None:
+                raise Http404('No Loan matches the given query.')
+            return Response(serializer.to_representation(row), status=status.HTTP_200_OK)
+        
+        loan = get_object_or_404(loans, loan_id=loan_id)
+        serializer = LoanDetailSerializer(loan)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class CustomerLoansView(APIView):
+    def get(self, request, customer_id):
+        customer = get_object_or_404(Customer.objects.using(shard_for_customer(customer_id)), customer_id=customer_id)
+        loans = customer.loans.filter(status='APPROVED')
+        if settings.FAST_READ_SERIALIZATION:
+            serializer = CustomerLoanRowSerializer()
+            return Response(serializer.many(loans.values(*serializer.sources)), status=status.HTTP_200_OK)
+        
+        serializer = CustomerLoanSerializer(loans, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class RepaymentPostView(APIView):
+    def post(self, request):
+        serializer = RepaymentSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Large files can be handed to Celery instead of holding the request open
+        if request.query_params.get('async') in ('1', 'true'):
+            result = post_repayments.delay(serializer.data)
+            return Response({"task_id": result.id}, status=status.HTTP_202_ACCEPTED)
+        
+        summary = post_repayments(serializer.validated_data)
+        return Response(summary, status=status.HTTP_200_OK)
+
+class PortfolioExposureView(APIView):
+    def get(self, request):
+        return Response(get_portfolio_exposure(), status=status.HTTP_200_OK)
+
+class AdmissionStatsView(APIView):
+    def get(self, request):
+        # Totals across workers, plus the live state of the one answering
+        return Response({
+            'cluster': cluster_stats(),
+            'worker': get_controller().stats(),
+        }, status=status.HTTP_200_OK)
@@ -1,176 +1,279 @@
-"""
-Django settings for credit_project project.
-
-Generated by 'django-admin startproject' using Django 5.2.6.
-
-For more information on this file, see
-https://docs.djangoproject.com/en/5.2/topics/settings/
-
-For the full list of settings and their values, see
-https://docs.djangoproject.com/en/5.2/ref/settings/
-"""
-
-from pathlib import Path
-import os
-
-# Build paths inside the project like this: BASE_DIR / 'subdir'.
-BASE_DIR = Path(__file__).resolve().parent.parent
-
-
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
-
-# SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-&x!+pi547&@ql8r7h#mzmxv6o8!1w*a_qr2&nv%u60h38jln9j'
-
-# SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
-
-ALLOWED_HOSTS = ['*']
-
-
-# Application definition
-
-INSTALLED_APPS = [
-    'django.contrib.admin',
-    'django.contrib.auth',
-    'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
-    'django.contrib.staticfiles',
-    'rest_framework',
-    'credit_app',
-]
-
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-]
-
-ROOT_URLCONF = 'credit_project.urls'
-
-TEMPLATES = [
-    {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
-        'APP_DIRS': True,
-        'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-            ],
-        },
-    },
-]
-
-WSGI_APPLICATION = 'credit_project.wsgi.application'
-
-
-# Database
-# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-# Check if running in Docker or locally
-import socket
-IS_DOCKER = False
-try:
-    socket.gethostbyname('db')
-    IS_DOCKER = True
-except socket.gaierror:
-    IS_DOCKER = False
-
-if IS_DOCKER:
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': os.environ.get('POSTGRES_DB', 'credit_db'),
-            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
-            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
-            'HOST': os.environ.get('POSTGRES_HOST', 'db'),
-            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
-        }
-    }
-else:
-    # Use SQLite for local development
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
-        }
-    }
-
-
-# Password validation
-# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
-
-AUTH_PASSWORD_VALIDATORS = [
-    {
-        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
-    },
-    {
-        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
-    },
-]
-
-
-# Internationalization
-# https://docs.djangoproject.com/en/5.2/topics/i18n/
-
-LANGUAGE_CODE = 'en-us'
-
-TIME_ZONE = 'UTC'
-
-USE_I18N = True
-
-USE_TZ = True
-
-
-# Static files (CSS, JavaScript, Images)
-# https://docs.djangoproject.com/en/5.2/howto/static-files/
-
-STATIC_URL = 'static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-
-# Default primary key field type
-# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
-
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-
-# Celery Configuration
-if IS_DOCKER:
-    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
-    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
-else:
-    # Use localhost for local development
-    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
-    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
-
-CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = TIME_ZONE
-
-# REST Framework settings
-REST_FRAMEWORK = {
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-    ],
-    'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
-    ],
-}
-
-# Create data directory if it doesn't exist
-DATA_DIR = os.path.join(BASE_DIR.parent, 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
+"""
+Django settings for credit_project project.
+
+Generated by 'django-admin startproject' using Django 5.2.6.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+
+from pathlib import Path
+import os
+import sys
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'django-insecure-&x!+pi547&@ql8r7h#mzmxv6o8!1w*a_qr2&nv%u60h38jln9j'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = True
+
+ALLOWED_HOSTS = ['*']
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'rest_framework',
+    'credit_app',
+]
+
+MIDDLEWARE = [
+    'credit_app.profiling.ProfilingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'credit_project.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'credit_project.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+
+# Check if running in Docker or locally
+import socket
+IS_DOCKER = False
+try:
+    socket.gethostbyname('db')
+    IS_DOCKER = True
+except socket.gaierror:
+    IS_DOCKER = False
+
+if IS_DOCKER:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'credit_db'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
+            'HOST': os.environ.get('POSTGRES_HOST', 'db'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        }
+    }
+else:
+    # Use SQLite for local development
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+# Customer-id sharding (see credit_app/sharding.py). 'default' is always
+# shard 0; extra shards are PostgreSQL hosts in Docker, or SQLite files
+# locally (CREDIT_SQLITE_SHARDS=3 gives db.sqlite3 plus two shard files).
+# `manage.py test` uses three SQLite shards unless CREDIT_SQLITE_SHARDS is set.
+TESTING = sys.argv[1:2] == ['test']
+CREDIT_SHARDS = ['default']
+# Run per-shard work in one thread per shard (tests run it inline instead)
+CREDIT_PARALLEL_SHARDS = True
+if IS_DOCKER:
+    shard_hosts = [host for host in os.environ.get('POSTGRES_SHARD_HOSTS', '').split(',') if host]
+    for index, host in enumerate(shard_hosts, start=1):
+        DATABASES[f'shard_{index}'] = {**DATABASES['default'], 'HOST': host}
+        CREDIT_SHARDS.append(f'shard_{index}')
+else:
+    for index in range(1, int(os.environ.get('CREDIT_SQLITE_SHARDS', '3' if TESTING else '1'))):
+        DATABASES[f'shard_{index}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'db_shard_{index}.sqlite3',
+        }
+        CREDIT_SHARDS.append(f'shard_{index}')
+
+DATABASE_ROUTERS = ['credit_app.sharding.ShardRouter']
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_URL = 'static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Cache (portfolio analytics)
+if IS_DOCKER:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('CACHE_URL', 'redis://redis:6379/1'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+PORTFOLIO_EXPOSURE_CACHE_TIMEOUT = 300  # seconds
+
+# Celery Configuration
+if IS_DOCKER:
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
+else:
+    # Use localhost for local development
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_TIMEZONE = TIME_ZONE
+
+# Periodic tasks (run with `celery beat`)
+from celery.schedules import crontab
+CELERY_BEAT_SCHEDULE = {
+    'sweep-loan-lifecycle': {
+        'task': 'credit_app.tasks.sweep_loan_lifecycle',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'write-portfolio-snapshot': {
+        'task': 'credit_app.tasks.write_portfolio_snapshot',
+        'schedule': crontab(minute=15),
+    },
+}
+
+# REST Framework settings
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+    ],
+}
+
+# Largest batch accepted by /register-bulk/
+BULK_REGISTRATION_MAX_ITEMS = 20000
+
+# Render /view-loan/ and /view-loans/ from values() rows instead of model
+# instances (same payload, see credit_app.serializers.ValuesRowSerializer)
+FAST_READ_SERIALIZATION = True
+
+# Create data directory if it doesn't exist
+DATA_DIR = os.path.join(BASE_DIR.parent, 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Columnar analytics snapshots (see credit_app/snapshot.py)
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(DATA_DIR, 'snapshots'))
+SNAPSHOT_KEEP = 3
+
+# Ingestion run reports (rejected-row CSVs)
+INGESTION_REPORT_DIR = os.path.join(DATA_DIR, 'ingestion_reports')
+INGESTION_MAX_REJECTED_ROWS = 1000
+
+# On-demand request profiling (credit_app/profiling.py). Requests sent with
+# `X-Profile: <PROFILING_TOKEN>`, or a PROFILING_SAMPLE_RATE fraction of all
+# requests, are profiled. With neither set the middleware is disabled.
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILING_MAX_ENTRIES = 200
+PROFILING_MAX_STATEMENTS = 500
+
+# Decision audit log (credit_app/audit.py). Decisions are buffered in each
+# process and written in batches of AUDIT_BATCH_SIZE, at least every
+# AUDIT_FLUSH_INTERVAL seconds; a full buffer makes the request write a batch.
+# A batch that fails AUDIT_MAX_ATTEMPTS times goes to AUDIT_DEAD_LETTER_DIR.
+AUDIT_ENABLED = True
+AUDIT_BUFFER_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 2.0  # seconds
+AUDIT_MAX_ATTEMPTS = 3
+AUDIT_DEAD_LETTER_DIR = os.path.join(DATA_DIR, 'audit_dead_letter')
+
+# Admission control for /check-eligibility/, /quote-offers/ and /create-loan/
+# (credit_app/admission.py), per worker process. Keep ADMISSION_MAX_IN_FLIGHT
+# below gunicorn's --threads so other endpoints always have a free thread.
+ADMISSION_CONTROL_ENABLED = True
+ADMISSION_MAX_IN_FLIGHT = 4
+ADMISSION_RESERVED_FOR_WRITES = 1
+ADMISSION_MAX_QUEUE = 8  # per priority
+ADMISSION_MAX_PER_CUSTOMER = 2
+ADMISSION_READ_QUEUE_TIMEOUT = 0.25  # seconds
+ADMISSION_WRITE_QUEUE_TIMEOUT = 2.0  # seconds
+ADMISSION_RETRY_AFTER = 1  # seconds
+ADMISSION_STATS_INTERVAL = 1.0  # seconds between publishing counts to the shared cache
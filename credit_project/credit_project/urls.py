@@ -1,30 +1,36 @@
-"""URL configuration for credit_project project.
-
-The `urlpatterns` list routes URLs to views. For more information please see:
-    https://docs.djangoproject.com/en/5.2/topics/http/urls/
-Examples:
-Function views
-    1. Add an import:  from my_app import views
-    2. Add a URL to urlpatterns:  path('', views.home, name='home')
-Class-based views
-    1. Add an import:  from other_app.views import Home
-    2. Add a URL to urlpatterns:  path('', Home.as_view(), name='home')
-Including another URLconf
-    1. Import the include() function: from django.urls import include, path
-    2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
-"""
-from django.contrib import admin
-from django.urls import path
-from credit_app.views import (
-    CustomerRegistrationView, LoanEligibilityView,
-    LoanCreateView, LoanDetailView, CustomerLoansView
-)
-
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('register/', CustomerRegistrationView.as_view(), name='register'),
-    path('check-eligibility/', LoanEligibilityView.as_view(), name='check-eligibility'),
-    path('create-loan/', LoanCreateView.as_view(), name='create-loan'),
-    path('view-loan/<int:loan_id>/', LoanDetailView.as_view(), name='view-loan'),
-    path('view-loans/<int:customer_id>/', CustomerLoansView.as_view(), name='view-loans'),
-]
+"""URL configuration for credit_project project.
+
+The `urlpatterns` list routes URLs to views. For more information please see:
+    https://docs.djangoproject.com/en/5.2/topics/http/urls/
+Examples:
+Function views
+    1. Add an import:  from my_app import views
+    2. Add a URL to urlpatterns:  path('', views.home, name='home')
+Class-based views
+    1. Add an import:  from other_app.views import Home
+    2. Add a URL to urlpatterns:  path('', Home.as_view(), name='home')
+Including another URLconf
+    1. Import the include() function: from django.urls import include, path
+    2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
+"""
+from django.contrib import admin
+from django.urls import path
+from credit_app.views import (
+    CustomerRegistrationView, BulkCustomerRegistrationView, LoanEligibilityView, LoanQuoteView,
+    LoanCreateView, LoanDetailView, CustomerLoansView,
+    RepaymentPostView, PortfolioExposureView, AdmissionStatsView
+)
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('register/', CustomerRegistrationView.as_view(), name='register'),
+    path('register-bulk/', BulkCustomerRegistrationView.as_view(), name='register-bulk'),
+    path('check-eligibility/', LoanEligibilityView.as_view(), name='check-eligibility'),
+    path('quote-offers/', LoanQuoteView.as_view(), name='quote-offers'),
+    path('create-loan/', LoanCreateView.as_view(), name='create-loan'),
+    path('view-loan/<int:loan_id>/', LoanDetailView.as_view(), name='view-loan'),
+    path('view-loans/<int:customer_id>/', CustomerLoansView.as_view(), name='view-loans'),
+    path('post-repayments/', RepaymentPostView.as_view(), name='post-repayments'),
+    path('portfolio-exposure/', PortfolioExposureView.as_view(), name='portfolio-exposure'),
+    path('admission-stats/', AdmissionStatsView.as_view(), name='admission-stats'),
+]
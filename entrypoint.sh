@@ -13,6 +13,12 @@ echo "PostgreSQL is up - continuing..."
 echo "Applying database migrations..."
 python credit_project/manage.py migrate
 
+# Migrate any extra customer shards (shard_1..N, see POSTGRES_SHARD_HOSTS)
+IFS=',' read -ra SHARD_HOSTS <<< "${POSTGRES_SHARD_HOSTS:-}"
+for index in "${!SHARD_HOSTS[@]}"; do
+  python credit_project/manage.py migrate --database "shard_$((index + 1))"
+done
+
 # Create superuser if needed
 if [ "$DJANGO_SUPERUSER_USERNAME" ] && [ "$DJANGO_SUPERUSER_EMAIL" ] && [ "$DJANGO_SUPERUSER_PASSWORD" ]; then
   python credit_project/manage.py createsuperuser --noinput
@@ -20,4 +26,4 @@ fi
 
 # Start Gunicorn server
 echo "Starting Gunicorn server..."
-exec gunicorn --bind 0.0.0.0:8000 --workers 3 --chdir credit_project credit_project.wsgi:application
\ No newline at end of file
+exec gunicorn --bind 0.0.0.0:8000 --workers 3 --threads 8 --chdir credit_project credit_project.wsgi:application
\ No newline at end of file